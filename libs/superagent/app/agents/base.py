@@ -1,14 +1,20 @@
-from typing import Any, List
+import logging
+import time
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
 
-from app.utils.prisma import prisma
+from app.agents.cache import get_agent_version
+from app.agents.loader import load_agent_config
 from app.utils.streaming import CustomAsyncIteratorCallbackHandler
 from prisma.models import Agent, AgentDatasource, AgentLLM, AgentTool
+from prisma.partials import AgentConfig
 
 DEFAULT_PROMPT = (
     "You are a helpful AI Assistant, anwer the users questions to "
     "the best of your ability."
 )
 
+logger = logging.getLogger(__name__)
+
 
 class AgentBase:
     def __init__(
@@ -18,12 +24,37 @@ class AgentBase:
         enable_streaming: bool = False,
         output_schema: str = None,
         callback: CustomAsyncIteratorCallbackHandler = None,
+        enable_memory: bool = True,
+        config: Optional[AgentConfig] = None,
     ):
         self.agent_id = agent_id
         self.session_id = session_id
         self.enable_streaming = enable_streaming
         self.output_schema = output_schema
         self.callback = callback
+        # Without memory the agent neither loads nor saves chat history, which
+        # makes it safe to run on independent inputs concurrently
+        self.enable_memory = enable_memory
+        # Agent config loaded by the caller, loaded by `get_agent` when missing
+        self.config = config
+        # Seconds spent on each part of the agent build, see `get_agent`
+        self.timings: Dict[str, float] = {}
+        # Version of the agent config, set by `load_config`
+        self.version: Optional[Tuple] = None
+
+    async def _timed(self, name: str, awaitable: Awaitable) -> Any:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def get_server_timing(self) -> str:
+        """Agent build timings formatted as a `Server-Timing` header value"""
+        return ", ".join(
+            f"agent-{name};dur={duration * 1000:.1f}"
+            for name, duration in self.timings.items()
+        )
 
     async def _get_tools(
         self, agent_datasources: List[AgentDatasource], agent_tools: List[AgentTool]
@@ -39,17 +70,21 @@ class AgentBase:
     async def _get_memory(self) -> List:
         raise NotImplementedError
 
+    async def load_config(self) -> AgentConfig:
+        """
+        Loads the agent config unless the caller passed it and sets its version,
+        which is all that is needed to look up cached answers of the agent
+        """
+        if self.config is None:
+            self.config = await self._timed(
+                "config", load_agent_config(agent_id=self.agent_id)
+            )
+        self.version = get_agent_version(self.config)
+        return self.config
+
     async def get_agent(self):
-        agent_config = await prisma.agent.find_unique_or_raise(
-            where={"id": self.agent_id},
-            include={
-                "llms": {"include": {"llm": True}},
-                "datasources": {
-                    "include": {"datasource": {"include": {"vectorDb": True}}}
-                },
-                "tools": {"include": {"tool": True}},
-            },
-        )
+        start = time.perf_counter()
+        agent_config = await self.load_config()
 
         if agent_config.llms[0].llm.provider in ["OPENAI", "AZURE_OPENAI"]:
             from app.agents.langchain import LangchainAgent
@@ -60,6 +95,7 @@ class AgentBase:
                 enable_streaming=self.enable_streaming,
                 output_schema=self.output_schema,
                 callback=self.callback,
+                enable_memory=self.enable_memory,
             )
         else:
             from app.agents.superagent import SuperagentAgent
@@ -70,6 +106,18 @@ class AgentBase:
                 enable_streaming=self.enable_streaming,
                 output_schema=self.output_schema,
                 callback=self.callback,
+                enable_memory=self.enable_memory,
             )
 
-        return await agent.get_agent(config=agent_config)
+        try:
+            return await agent.get_agent(config=agent_config)
+        finally:
+            self.timings.update(agent.timings)
+            self.timings["total"] = time.perf_counter() - start
+            logger.info(
+                "Agent build timings: "
+                + ", ".join(
+                    f"{name}={duration * 1000:.1f}ms"
+                    for name, duration in self.timings.items()
+                )
+            )
@@ -0,0 +1,87 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+from decouple import config
+
+from prisma.models import Agent
+
+logger = logging.getLogger(__name__)
+
+
+def get_agent_version(agent: Agent) -> Tuple[Hashable, ...]:
+    """
+    Returns a version key for an agent config, built from the `updatedAt` of the
+    agent and every LLM, tool, datasource and vector database attached to it.
+    Join rows are included so that adding or removing a relation changes the key.
+    """
+    llms = sorted((llm.llmId, llm.llm.updatedAt) for llm in agent.llms or [])
+    tools = sorted((tool.toolId, tool.tool.updatedAt) for tool in agent.tools or [])
+    datasources = sorted(
+        (
+            agent_datasource.datasourceId,
+            agent_datasource.datasource.updatedAt,
+            agent_datasource.datasource.vectorDb.updatedAt
+            if agent_datasource.datasource.vectorDb
+            else None,
+        )
+        for agent_datasource in agent.datasources or []
+    )
+    return (
+        agent.updatedAt,
+        agent.llmModel,
+        tuple(llms),
+        tuple(tools),
+        tuple(datasources),
+    )
+
+
+def get_version_hash(version: Tuple[Hashable, ...]) -> str:
+    """Short, stable digest of an agent version for use in external stores"""
+    return hashlib.sha256(repr(version).encode()).hexdigest()[:16]
+
+
+class CompiledAgent:
+    """Session independent parts of an agent, safe to share between invocations"""
+
+    def __init__(self, llm: Any, tools: List[Any]):
+        self.llm = llm
+        self.tools = tools
+
+
+class AgentCache:
+    """Process-local LRU cache of compiled agents keyed by agent id and version"""
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[Tuple, CompiledAgent]]" = OrderedDict()
+
+    def get(self, agent_id: str, version: Tuple) -> Optional[CompiledAgent]:
+        entry = self._entries.get(agent_id)
+        if entry is None:
+            return None
+        cached_version, compiled_agent = entry
+        if cached_version != version:
+            del self._entries[agent_id]
+            return None
+        self._entries.move_to_end(agent_id)
+        return compiled_agent
+
+    def set(self, agent_id: str, version: Tuple, compiled_agent: CompiledAgent):
+        if self.max_size <= 0:
+            return
+        self._entries[agent_id] = (version, compiled_agent)
+        self._entries.move_to_end(agent_id)
+        while len(self._entries) > self.max_size:
+            evicted_agent_id, _ = self._entries.popitem(last=False)
+            logger.debug(f"Evicted compiled agent `{evicted_agent_id}` from cache")
+
+    def invalidate(self, agent_id: str):
+        self._entries.pop(agent_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+agent_cache = AgentCache(max_size=config("AGENT_CACHE_SIZE", default=512, cast=int))
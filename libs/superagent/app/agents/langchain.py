@@ -1,17 +1,21 @@
+import asyncio
 import datetime
 import json
+from functools import partial
 from typing import Any, List
 
 from decouple import config
 from langchain.agents import AgentType, initialize_agent
 from langchain.chains import LLMChain
 from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
+from langchain.memory import ConversationBufferMemory, ReadOnlySharedMemory
 from langchain.memory.motorhead_memory import MotorheadMemory
 from langchain.prompts import MessagesPlaceholder, PromptTemplate
 from langchain.schema import SystemMessage
 from slugify import slugify
 
 from app.agents.base import AgentBase
+from app.agents.cache import CompiledAgent, agent_cache, get_agent_version
 from app.datasource.types import (
     VALID_UNSTRUCTURED_DATA_TYPES,
 )
@@ -26,6 +30,9 @@ DEFAULT_PROMPT = (
     "the best of your ability."
 )
 
+# Tools that do network I/O when they are created
+BLOCKING_TOOL_TYPES = ["CHATGPT_PLUGIN"]
+
 
 def recursive_json_loads(data):
     if isinstance(data, str):
@@ -76,43 +83,64 @@ class LangchainAgent(AgentBase):
                 return_direct=False,
             )
             tools.append(tool)
-        for agent_tool in agent_tools:
-            tool_info = TOOL_TYPE_MAPPING.get(agent_tool.tool.type)
-            if agent_tool.tool.type == "FUNCTION":
-                metadata = recursive_json_loads(agent_tool.tool.metadata)
-                args = metadata.get("args", {})
-                PydanticModel = create_pydantic_model_from_object(args)
-                tool = create_tool(
-                    tool_class=tool_info["class"],
-                    name=metadata.get("functionName"),
-                    description=agent_tool.tool.description,
-                    metadata=agent_tool.tool.metadata,
-                    args_schema=PydanticModel,
-                    return_direct=agent_tool.tool.returnDirect,
-                )
-            else:
-                tool = create_tool(
-                    tool_class=tool_info["class"],
-                    name=slugify(agent_tool.tool.name),
-                    description=agent_tool.tool.description,
-                    metadata=agent_tool.tool.metadata,
-                    args_schema=tool_info["schema"],
-                    session_id=f"{self.agent_id}-{self.session_id}"
-                    if self.session_id
-                    else f"{self.agent_id}",
-                    return_direct=agent_tool.tool.returnDirect,
-                )
-            tools.append(tool)
+        tools.extend(
+            await asyncio.gather(
+                *[self._get_tool(agent_tool=agent_tool) for agent_tool in agent_tools]
+            )
+        )
         return tools
 
+    async def _get_tool(self, agent_tool: AgentTool) -> Any:
+        tool_info = TOOL_TYPE_MAPPING.get(agent_tool.tool.type)
+        if agent_tool.tool.type == "FUNCTION":
+            metadata = recursive_json_loads(agent_tool.tool.metadata)
+            args = metadata.get("args", {})
+            PydanticModel = create_pydantic_model_from_object(args)
+            tool_kwargs = {
+                "tool_class": tool_info["class"],
+                "name": metadata.get("functionName"),
+                "description": agent_tool.tool.description,
+                "metadata": agent_tool.tool.metadata,
+                "args_schema": PydanticModel,
+                "return_direct": agent_tool.tool.returnDirect,
+            }
+        else:
+            tool_kwargs = {
+                "tool_class": tool_info["class"],
+                "name": slugify(agent_tool.tool.name),
+                "description": agent_tool.tool.description,
+                "metadata": agent_tool.tool.metadata,
+                "args_schema": tool_info["schema"],
+                "return_direct": agent_tool.tool.returnDirect,
+            }
+        if agent_tool.tool.type in BLOCKING_TOOL_TYPES:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, partial(create_tool, **tool_kwargs))
+        return create_tool(**tool_kwargs)
+
+    def _bind_tools(self, tools: List) -> List:
+        session_id = (
+            f"{self.agent_id}-{self.session_id}"
+            if self.session_id
+            else f"{self.agent_id}"
+        )
+        bound_tools = []
+        for tool in tools:
+            update = {}
+            if tool.metadata and "sessionId" in tool.metadata:
+                update["metadata"] = {**tool.metadata, "sessionId": session_id}
+            if self.enable_streaming:
+                # Streams tool calls to the client as they start and end
+                update["callbacks"] = [self.callback]
+            bound_tools.append(tool.copy(update=update) if update else tool)
+        return bound_tools
+
     async def _get_llm(self, agent_llm: AgentLLM, model: str) -> Any:
         if agent_llm.llm.provider == "OPENAI":
             return ChatOpenAI(
                 model=LLM_MAPPING[model],
                 openai_api_key=agent_llm.llm.apiKey,
                 temperature=0,
-                streaming=self.enable_streaming,
-                callbacks=[self.callback] if self.enable_streaming else [],
                 **(agent_llm.llm.options if agent_llm.llm.options else {}),
             )
         if agent_llm.llm.provider == "AZURE_OPENAI":
@@ -120,11 +148,17 @@ class LangchainAgent(AgentBase):
                 api_key=agent_llm.llm.apiKey,
                 temperature=0,
                 openai_api_type="azure",
-                streaming=self.enable_streaming,
-                callbacks=[self.callback] if self.enable_streaming else [],
                 **(agent_llm.llm.options if agent_llm.llm.options else {}),
             )
 
+    def _bind_llm(self, llm: Any) -> Any:
+        return llm.copy(
+            update={
+                "streaming": self.enable_streaming,
+                "callbacks": [self.callback] if self.enable_streaming else [],
+            }
+        )
+
     async def _get_prompt(self, agent: Agent) -> str:
         if self.output_schema:
             if agent.prompt:
@@ -153,6 +187,14 @@ class LangchainAgent(AgentBase):
         return SystemMessage(content=content)
 
     async def _get_memory(self) -> List:
+        if not self.enable_memory:
+            return ReadOnlySharedMemory(
+                memory=ConversationBufferMemory(
+                    memory_key="chat_history",
+                    return_messages=True,
+                    output_key="output",
+                )
+            )
         memory = MotorheadMemory(
             session_id=f"{self.agent_id}-{self.session_id}"
             if self.session_id
@@ -162,16 +204,41 @@ class LangchainAgent(AgentBase):
             return_messages=True,
             output_key="output",
         )
-        await memory.init()
+        # `MotorheadMemory.init` does a blocking HTTP request, so it runs on a
+        # worker thread to let the rest of the agent be assembled meanwhile
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, asyncio.run, memory.init())
         return memory
 
+    async def _get_compiled_agent(self, config: Agent) -> CompiledAgent:
+        version = get_agent_version(config)
+        compiled_agent = agent_cache.get(self.agent_id, version)
+        if compiled_agent is None:
+            llm, tools = await asyncio.gather(
+                self._timed(
+                    "llm",
+                    self._get_llm(agent_llm=config.llms[0], model=config.llmModel),
+                ),
+                self._timed(
+                    "tools",
+                    self._get_tools(
+                        agent_datasources=config.datasources,
+                        agent_tools=config.tools,
+                    ),
+                ),
+            )
+            compiled_agent = CompiledAgent(llm=llm, tools=tools)
+            agent_cache.set(self.agent_id, version, compiled_agent)
+        return compiled_agent
+
     async def get_agent(self, config: Agent):
-        llm = await self._get_llm(agent_llm=config.llms[0], model=config.llmModel)
-        tools = await self._get_tools(
-            agent_datasources=config.datasources, agent_tools=config.tools
+        compiled_agent, prompt, memory = await asyncio.gather(
+            self._timed("compile", self._get_compiled_agent(config=config)),
+            self._timed("prompt", self._get_prompt(agent=config)),
+            self._timed("memory", self._get_memory()),
         )
-        prompt = await self._get_prompt(agent=config)
-        memory = await self._get_memory()
+        llm = self._bind_llm(compiled_agent.llm)
+        tools = self._bind_tools(compiled_agent.tools)
 
         if len(tools) > 0:
             agent = initialize_agent(
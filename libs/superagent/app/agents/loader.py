@@ -0,0 +1,16 @@
+from prisma.partials import AgentConfig
+
+# Only the relations needed to build an agent at runtime. Datasources are
+# loaded through the `DatasourceConfig` partial so `content` is never selected.
+AGENT_CONFIG_INCLUDE = {
+    "llms": {"include": {"llm": True}},
+    "datasources": {"include": {"datasource": {"include": {"vectorDb": True}}}},
+    "tools": {"include": {"tool": True}},
+}
+
+
+async def load_agent_config(agent_id: str) -> AgentConfig:
+    return await AgentConfig.prisma().find_unique_or_raise(
+        where={"id": agent_id},
+        include=AGENT_CONFIG_INCLUDE,
+    )
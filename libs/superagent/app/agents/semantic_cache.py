@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from decouple import config
+
+from app.agents.cache import get_version_hash
+from app.vectorstores.base import VectorStoreBase
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = config("SEMANTIC_CACHE_ENABLED", False, cast=bool)
+SEMANTIC_CACHE_THRESHOLD = config("SEMANTIC_CACHE_THRESHOLD", 0.95, cast=float)
+# Vector stores limit the size of metadata, larger outputs are not cached
+SEMANTIC_CACHE_MAX_OUTPUT_LENGTH = 20000
+
+
+class SemanticCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.lookup_time = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def average_lookup_time(self) -> float:
+        lookups = self.hits + self.misses
+        return self.lookup_time / lookups if lookups else 0.0
+
+    def dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "average_lookup_time": self.average_lookup_time,
+        }
+
+
+class SemanticCache:
+    """
+    Caches agent answers in the vector store, tagged with
+    `{"agentId": ..., "type": "cache"}`, and answers near-duplicate questions
+    from it. Entries are scoped to the agent config version, so changes to the
+    agent or its datasources never serve stale answers.
+    """
+
+    def __init__(self, enabled: bool, threshold: float):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.stats = SemanticCacheStats()
+        self._vector_store: Optional[VectorStoreBase] = None
+
+    @property
+    def vector_store(self) -> Optional[VectorStoreBase]:
+        if self._vector_store is None and self.enabled:
+            try:
+                vector_store = VectorStoreBase(options={}, vector_db_provider=None)
+            except Exception as e:
+                logger.error(f"Semantic cache disabled, no vectorstore: {e}")
+                self.enabled = False
+                return None
+            if not vector_store.supports_cache:
+                logger.warning(
+                    f"Semantic cache disabled, vectorstore {vector_store.vectorstore} "
+                    "does not support it"
+                )
+                self.enabled = False
+                return None
+            self._vector_store = vector_store
+        return self._vector_store
+
+    def _get_metadata_filter(
+        self, agent_id: str, version: Tuple, output_schema: Optional[str]
+    ) -> dict:
+        return {
+            "agentId": agent_id,
+            "version": get_version_hash(version),
+            "outputSchema": hashlib.sha256(output_schema.encode()).hexdigest()[:16]
+            if output_schema
+            else "",
+        }
+
+    async def lookup(
+        self,
+        agent_id: str,
+        version: Tuple,
+        input: str,
+        output_schema: Optional[str] = None,
+    ) -> Tuple[Optional[str], Optional[List[float]]]:
+        """
+        Returns the cached output for the input, if any, and the embedding of the
+        input to pass on to `store`.
+        """
+        vector_store = self.vector_store
+        if vector_store is None:
+            return None, None
+
+        start = time.perf_counter()
+        loop = asyncio.get_event_loop()
+        try:
+            vector = await loop.run_in_executor(
+                None, vector_store.instance.embeddings.embed_query, input
+            )
+            entry = await loop.run_in_executor(
+                None,
+                vector_store.query_cache,
+                vector,
+                self._get_metadata_filter(agent_id, version, output_schema),
+                self.threshold,
+            )
+        except Exception as e:
+            logger.error(f"Semantic cache lookup failed: {e}")
+            return None, None
+        elapsed = time.perf_counter() - start
+        self.stats.lookup_time += elapsed
+
+        if entry is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        logger.info(
+            f"Semantic cache {'hit' if entry else 'miss'} for agent {agent_id} "
+            f"in {elapsed * 1000:.1f}ms, hit rate {self.stats.hit_rate:.1%}"
+        )
+        return (entry.get("output") if entry else None), vector
+
+    async def store(
+        self,
+        agent_id: str,
+        version: Tuple,
+        input: str,
+        output: str,
+        vector: List[float],
+        output_schema: Optional[str] = None,
+    ):
+        if not output or len(output) > SEMANTIC_CACHE_MAX_OUTPUT_LENGTH:
+            return
+        vector_store = self.vector_store
+        if vector_store is None or vector is None:
+            return
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(
+                None,
+                vector_store.add_cache_entry,
+                vector,
+                input,
+                {
+                    **self._get_metadata_filter(agent_id, version, output_schema),
+                    "output": output,
+                },
+            )
+        except Exception as e:
+            logger.error(f"Failed to store semantic cache entry: {e}")
+
+    async def clear(self, agent_id: str):
+        """Deletes all cache entries of an agent"""
+        vector_store = self.vector_store
+        if vector_store is None:
+            return
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, vector_store.clear_cache, agent_id)
+        except Exception as e:
+            logger.error(f"Failed to clear semantic cache of agent {agent_id}: {e}")
+
+
+semantic_cache = SemanticCache(
+    enabled=SEMANTIC_CACHE_ENABLED, threshold=SEMANTIC_CACHE_THRESHOLD
+)
@@ -1,11 +1,11 @@
 import asyncio
 import json
 import logging
-from typing import AsyncIterable
+from typing import Any, AsyncIterable, Optional
 
 import segment.analytics as analytics
 from decouple import config
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response, status
 from fastapi.responses import StreamingResponse
 from langchain.agents import AgentExecutor
 from langchain.chains import LLMChain
@@ -14,6 +14,8 @@ from langfuse.model import CreateTrace
 from langsmith import Client
 
 from app.agents.base import AgentBase
+from app.agents.cache import agent_cache
+from app.agents.semantic_cache import semantic_cache
 from app.models.request import (
     Agent as AgentRequest,
 )
@@ -23,6 +25,9 @@ from app.models.request import (
 from app.models.request import (
     AgentInvoke as AgentInvokeRequest,
 )
+from app.models.request import (
+    AgentInvokeBatch as AgentInvokeBatchRequest,
+)
 from app.models.request import (
     AgentLLM as AgentLLMRequest,
 )
@@ -45,18 +50,34 @@ from app.models.response import AgentRunList as AgentRunListResponse
 from app.models.response import (
     AgentToolList as AgentToolListResponse,
 )
+from app.utils.admission import AdmissionTicket, admit_invocation
 from app.utils.api import get_current_api_user, handle_exception
+from app.utils.jobs import create_job
 from app.utils.llm import LLM_PROVIDER_MAPPING
 from app.utils.prisma import prisma
-from app.utils.streaming import CustomAsyncIteratorCallbackHandler
+from app.utils.single_flight import single_flight, streaming_single_flight
+from app.utils.streaming import (
+    CustomAsyncIteratorCallbackHandler,
+    format_sse,
+    stream_tokens,
+)
+from prisma.enums import JobType
 
 SEGMENT_WRITE_KEY = config("SEGMENT_WRITE_KEY", None)
+AGENT_BATCH_MAX_CONCURRENCY = config("AGENT_BATCH_MAX_CONCURRENCY", 20, cast=int)
+SINGLE_FLIGHT_ENABLED = config("SINGLE_FLIGHT_ENABLED", False, cast=bool)
 
 router = APIRouter()
 analytics.write_key = SEGMENT_WRITE_KEY
 logging.basicConfig(level=logging.INFO)
 
 
+async def invalidate_agent(agent_id: str):
+    """Drops the compiled agent and the cached answers of an agent"""
+    agent_cache.invalidate(agent_id)
+    await semantic_cache.clear(agent_id)
+
+
 # Agent endpoints
 @router.post(
     "/agents",
@@ -159,6 +180,7 @@ async def delete(agent_id: str, api_user=Depends(get_current_api_user)):
         if SEGMENT_WRITE_KEY:
             analytics.track(api_user.id, "Deleted Agent")
         await prisma.agent.delete(where={"id": agent_id})
+        await invalidate_agent(agent_id)
         return {"success": True, "data": None}
     except Exception as e:
         handle_exception(e)
@@ -184,6 +206,7 @@ async def update(
                 "apiUserId": api_user.id,
             },
         )
+        await invalidate_agent(agent_id)
         return {"success": True, "data": data}
     except Exception as e:
         handle_exception(e)
@@ -196,7 +219,11 @@ async def update(
     response_model=AgentInvokeResponse,
 )
 async def invoke(
-    agent_id: str, body: AgentInvokeRequest, api_user=Depends(get_current_api_user)
+    agent_id: str,
+    body: AgentInvokeRequest,
+    response: Response,
+    api_user=Depends(get_current_api_user),
+    admission_ticket: AdmissionTicket = Depends(admit_invocation),
 ):
     """Endpoint for invoking an agent"""
 
@@ -222,39 +249,78 @@ async def invoke(
         langfuse_handler = trace.get_langchain_handler()
 
     async def send_message(
-        agent: LLMChain | AgentExecutor,
+        agent: Optional[LLMChain | AgentExecutor],
         content: str,
         callback: CustomAsyncIteratorCallbackHandler,
     ) -> AsyncIterable[str]:
-        try:
-            task = asyncio.ensure_future(
-                agent.acall(
-                    inputs={"input": content},
-                    tags=[agent_id],
-                    callbacks=[langfuse_handler] if langfuse_handler else None,
-                )
+        if agent is None:
+            # Built lazily when the stream is shared, see `single_flight_key`
+            try:
+                agent = await agent_base.get_agent()
+            except Exception as e:
+                logging.error(f"Error in send_message: {e}")
+                return
+        task = asyncio.ensure_future(
+            agent.acall(
+                inputs={"input": content},
+                tags=[agent_id],
+                callbacks=[langfuse_handler] if langfuse_handler else None,
             )
-
-            async for token in callback.aiter():
-                yield f"data: {token}\n\n"
-
-            await task
-            result = task.result()
-            if "intermediate_steps" in result:
-                for step in result["intermediate_steps"]:
-                    agent_action_message_log = step[0]
-                    function = agent_action_message_log.tool
-                    args = agent_action_message_log.tool_input
-                    if function and args:
-                        yield (
-                            "event: function_call\n"
-                            f'data: {{"function": "{function}", '
-                            f'"args": {json.dumps(args)}}}\n\n'
-                        )
+        )
+        try:
+            async for token in stream_tokens(
+                callback,
+                flush_interval_ms=body.streamFlushInterval,
+                flush_bytes=body.streamFlushBytes,
+            ):
+                yield format_sse(token)
+
+            result = await task
+            if cache_vector is not None:
+                asyncio.ensure_future(store_cached_output(result.get("output")))
         except Exception as e:
             logging.error(f"Error in send_message: {e}")
         finally:
             callback.done.set()
+            # The response is torn down before the agent finished when the
+            # client disconnects, stop the run instead of finishing it for nobody
+            if not task.done():
+                task.cancel()
+                logging.warning(
+                    f"Stream closed before completion, cancelled agent {agent_id}"
+                )
+                if SEGMENT_WRITE_KEY:
+                    analytics.track(api_user.id, "Cancelled Agent Invocation")
+
+    async def store_cached_output(output: str):
+        await semantic_cache.store(
+            agent_id,
+            agent_base.version,
+            input,
+            output,
+            cache_vector,
+            output_schema,
+        )
+
+    def parse_output(output: str) -> Any:
+        try:
+            return json.loads(output)
+        except Exception as e:
+            logging.error(f"Error parsing output: {e}")
+            return None
+
+    if body.mode == "async":
+        if SEGMENT_WRITE_KEY:
+            analytics.track(api_user.id, "Invoked Agent Async")
+        job = await create_job(
+            api_user_id=api_user.id,
+            type=JobType.AGENT,
+            input=body.dict(exclude={"mode", "webhookUrl"}),
+            agent_id=agent_id,
+            webhook_url=body.webhookUrl,
+        )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"success": True, "data": {"jobId": job.id}}
 
     if SEGMENT_WRITE_KEY:
         analytics.track(api_user.id, "Invoked Agent")
@@ -265,35 +331,155 @@ async def invoke(
     enable_streaming = body.enableStreaming
     output_schema = body.outputSchema
     callback = CustomAsyncIteratorCallbackHandler()
-    agent = await AgentBase(
+    agent_base = AgentBase(
         agent_id=agent_id,
         session_id=session_id,
         enable_streaming=enable_streaming,
         output_schema=output_schema,
         callback=callback,
-    ).get_agent()
+    )
+
+    # Answers depend on the conversation when there is a session, so only
+    # sessionless invocations are answered from the semantic cache. The lookup
+    # only needs the config version, the agent is built on a miss.
+    cached_output, cache_vector = None, None
+    if semantic_cache.enabled and not session_id:
+        await agent_base.load_config()
+        cached_output, cache_vector = await semantic_cache.lookup(
+            agent_id, agent_base.version, input, output_schema
+        )
+    if cached_output is not None:
+        server_timing = ", ".join(
+            [admission_ticket.get_server_timing(), agent_base.get_server_timing()]
+        )
+        if SEGMENT_WRITE_KEY:
+            analytics.track(api_user.id, "Cached Agent Invocation")
+        if enable_streaming:
+
+            async def send_cached_output() -> AsyncIterable[str]:
+                yield format_sse(cached_output)
+
+            return StreamingResponse(
+                send_cached_output(),
+                media_type="text/event-stream",
+                headers={"Server-Timing": server_timing},
+            )
+        response.headers["Server-Timing"] = server_timing
+        if output_schema:
+            return {"success": True, "data": parse_output(cached_output)}
+        return {"success": True, "data": {"input": input, "output": cached_output}}
+
+    # Identical concurrent sessionless invocations of the same agent version
+    # share a single run. The flight is joined before the agent is built, so
+    # only the first invocation builds it.
+    single_flight_key = None
+    if SINGLE_FLIGHT_ENABLED and not session_id:
+        await agent_base.load_config()
+        single_flight_key = (agent_id, agent_base.version, input, output_schema)
 
     if enable_streaming:
         logging.info("Streaming enabled. Preparing streaming response...")
 
-        generator = send_message(agent, content=input, callback=callback)
-        return StreamingResponse(generator, media_type="text/event-stream")
+        if single_flight_key:
+            generator = streaming_single_flight.subscribe(
+                (
+                    *single_flight_key,
+                    body.streamFlushInterval,
+                    body.streamFlushBytes,
+                ),
+                send_message(None, content=input, callback=callback),
+            )
+        else:
+            agent = await agent_base.get_agent()
+            generator = send_message(agent, content=input, callback=callback)
+        server_timing = ", ".join(
+            [admission_ticket.get_server_timing(), agent_base.get_server_timing()]
+        )
+        return StreamingResponse(
+            generator,
+            media_type="text/event-stream",
+            headers={"Server-Timing": server_timing},
+        )
 
     logging.info("Streaming not enabled. Invoking agent synchronously...")
-    output = await agent.acall(
-        inputs={"input": input},
-        tags=[agent_id],
-        callbacks=[langfuse_handler] if langfuse_handler else None,
+
+    async def run_agent() -> dict:
+        agent = await agent_base.get_agent()
+        output = await agent.acall(
+            inputs={"input": input},
+            tags=[agent_id],
+            callbacks=[langfuse_handler] if langfuse_handler else None,
+        )
+        if cache_vector is not None:
+            asyncio.ensure_future(store_cached_output(output.get("output")))
+        return output
+
+    if single_flight_key:
+        output = await single_flight.do(single_flight_key, run_agent)
+    else:
+        output = await run_agent()
+    response.headers["Server-Timing"] = ", ".join(
+        [admission_ticket.get_server_timing(), agent_base.get_server_timing()]
     )
     if output_schema:
-        try:
-            output = json.loads(output.get("output"))
-        except Exception as e:
-            logging.error(f"Error parsing output: {e}")
-            output = None
+        output = parse_output(output.get("output"))
     return {"success": True, "data": output}
 
 
+@router.post(
+    "/agents/{agent_id}/invoke/batch",
+    name="invoke_batch",
+    description="Invoke an agent on a batch of inputs",
+)
+async def invoke_batch(
+    agent_id: str,
+    body: AgentInvokeBatchRequest,
+    api_user=Depends(get_current_api_user),
+    _admission_ticket: AdmissionTicket = Depends(admit_invocation),
+):
+    """Endpoint for invoking an agent on a batch of inputs"""
+    if SEGMENT_WRITE_KEY:
+        analytics.track(api_user.id, "Invoked Agent Batch")
+
+    # Items are independent of each other, so the agent is built once without
+    # chat memory and shared by all of them
+    agent = await AgentBase(
+        agent_id=agent_id,
+        output_schema=body.outputSchema,
+        enable_memory=False,
+    ).get_agent()
+    semaphore = asyncio.Semaphore(
+        max(1, min(body.concurrency, AGENT_BATCH_MAX_CONCURRENCY))
+    )
+
+    async def invoke_item(index: int, input: str) -> dict:
+        async with semaphore:
+            try:
+                output = await agent.acall(inputs={"input": input}, tags=[agent_id])
+                output = output.get("output")
+                if body.outputSchema:
+                    output = json.loads(output)
+                return {"index": index, "success": True, "data": output}
+            except Exception as e:
+                logging.error(f"Error invoking batch item {index}: {e}")
+                return {"index": index, "success": False, "error": str(e)}
+
+    async def send_results() -> AsyncIterable[str]:
+        tasks = [
+            asyncio.ensure_future(invoke_item(index, input))
+            for index, input in enumerate(body.inputs)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield f"{json.dumps(await next_result)}\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    logging.info(f"Invoking agent on a batch of {len(body.inputs)} inputs...")
+    return StreamingResponse(send_results(), media_type="application/x-ndjson")
+
+
 # Agent LLM endpoints
 @router.post(
     "/agents/{agent_id}/llms",
@@ -307,6 +493,7 @@ async def add_llm(
     """Endpoint for adding an LLM to an agent"""
     try:
         await prisma.agentllm.create({**body.dict(), "agentId": agent_id})
+        await invalidate_agent(agent_id)
         return {"success": True, "data": None}
     except Exception as e:
         handle_exception(e)
@@ -325,6 +512,7 @@ async def remove_llm(
         await prisma.agentllm.delete(
             where={"agentId_llmId": {"agentId": agent_id, "llmId": llm_id}}
         )
+        await invalidate_agent(agent_id)
         return {"success": True, "data": None}
     except Exception as e:
         handle_exception(e)
@@ -360,6 +548,7 @@ async def add_tool(
             {"toolId": body.toolId, "agentId": agent_id},
             include={"tool": True},
         )
+        await invalidate_agent(agent_id)
         return {"success": True}
     except Exception as e:
         handle_exception(e)
@@ -400,6 +589,7 @@ async def remove_tool(
                 }
             }
         )
+        await invalidate_agent(agent_id)
         return {"success": True, "data": None}
     except Exception as e:
         handle_exception(e)
@@ -438,6 +628,7 @@ async def add_datasource(
             {"datasourceId": body.datasourceId, "agentId": agent_id},
             include={"datasource": True},
         )
+        await invalidate_agent(agent_id)
 
         # TODO:
         # Enable this for finetuning models
@@ -490,6 +681,7 @@ async def remove_datasource(
                 }
             }
         )
+        await invalidate_agent(agent_id)
 
         # TODO:
         # Enable this for finetuning models
@@ -4,7 +4,12 @@ from fastapi import APIRouter, Depends
 
 from app.models.request import ApiUser as ApiUserRequest
 from app.models.response import ApiUser as ApiUserResponse
-from app.utils.api import generate_jwt, get_current_api_user, handle_exception
+from app.utils.api import (
+    generate_jwt,
+    get_current_api_user,
+    handle_exception,
+    invalidate_api_user,
+)
 from app.utils.prisma import prisma
 
 SEGMENT_WRITE_KEY = config("SEGMENT_WRITE_KEY", None)
@@ -62,6 +67,8 @@ async def delete(api_user=Depends(get_current_api_user)):
     """Endpoint for deleting an api user"""
     try:
         await prisma.apiuser.delete(where={"id": api_user.id})
+        # Cached by id, whichever token the request was made with
+        await invalidate_api_user(api_user.id)
         return {"success": True, "data": None}
     except Exception as e:
         handle_exception(e)
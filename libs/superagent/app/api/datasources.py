@@ -6,7 +6,10 @@ import segment.analytics as analytics
 from decouple import config
 from fastapi import APIRouter, Depends, HTTPException
 
+from app.agents.cache import agent_cache
+from app.agents.semantic_cache import semantic_cache
 from app.datasource.flow import delete_datasource, vectorize_datasource
+from app.datasource.types import SYNCABLE_DATA_TYPES
 from app.models.request import Datasource as DatasourceRequest
 from app.models.response import (
     Datasource as DatasourceResponse,
@@ -25,6 +28,38 @@ router = APIRouter()
 analytics.write_key = SEGMENT_WRITE_KEY
 
 
+async def invalidate_datasource_agents(datasource_id: str):
+    """Drops the compiled agents and cached answers of agents using a datasource"""
+    agent_datasources = await prisma.agentdatasource.find_many(
+        where={"datasourceId": datasource_id}
+    )
+    for agent_datasource in agent_datasources:
+        agent_cache.invalidate(agent_datasource.agentId)
+        await semantic_cache.clear(agent_datasource.agentId)
+
+
+async def run_vectorize_flow(
+    datasource: Datasource,
+    options: Optional[dict],
+    vector_db_provider: Optional[str],
+):
+    try:
+        await vectorize_datasource(
+            datasource=datasource,
+            # vector db configurations (api key, index name etc.)
+            options=options,
+            vector_db_provider=vector_db_provider,
+        )
+        # Agents may have cached answers from the previous vectors
+        await invalidate_datasource_agents(datasource.id)
+    except Exception as flow_exception:
+        await prisma.datasource.update(
+            where={"id": datasource.id},
+            data={"status": DatasourceStatus.FAILED},
+        )
+        handle_exception(flow_exception)
+
+
 @router.post(
     "/datasources",
     name="create",
@@ -62,25 +97,6 @@ async def create(
             }
         )
 
-        async def run_vectorize_flow(
-            datasource: Datasource,
-            options: Optional[dict],
-            vector_db_provider: Optional[str],
-        ):
-            try:
-                await vectorize_datasource(
-                    datasource=datasource,
-                    # vector db configurations (api key, index name etc.)
-                    options=options,
-                    vector_db_provider=vector_db_provider,
-                )
-            except Exception as flow_exception:
-                await prisma.datasource.update(
-                    where={"id": datasource.id},
-                    data={"status": DatasourceStatus.FAILED},
-                )
-                handle_exception(flow_exception)
-
         asyncio.create_task(
             run_vectorize_flow(
                 datasource=data,
@@ -158,7 +174,58 @@ async def update(
             where={"id": datasource_id},
             data=body.dict(),
         )
+        await invalidate_datasource_agents(datasource_id)
+        return {"success": True, "data": data}
+    except Exception as e:
+        handle_exception(e)
+
+
+@router.post(
+    "/datasources/{datasource_id}/sync",
+    name="sync",
+    description="Re-ingest the changes of a repository or web page datasource",
+    response_model=DatasourceResponse,
+)
+async def sync(datasource_id: str, api_user=Depends(get_current_api_user)):
+    """Endpoint for syncing a specific datasource"""
+    try:
+        datasource = await prisma.datasource.find_first(
+            where={"id": datasource_id, "apiUserId": api_user.id},
+            include={"vectorDb": True},
+        )
+        if not datasource:
+            raise HTTPException(status_code=404, detail="Datasource not found")
+        if datasource.type not in SYNCABLE_DATA_TYPES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Datasources of type {datasource.type} can't be synced",
+            )
+
+        # Claimed atomically, two syncs at once would apply the same changes twice
+        claimed = await prisma.datasource.update_many(
+            where={
+                "id": datasource_id,
+                "status": {"not": DatasourceStatus.IN_PROGRESS},
+            },
+            data={"status": DatasourceStatus.IN_PROGRESS},
+        )
+        if not claimed:
+            raise HTTPException(
+                status_code=409, detail="Datasource is already being ingested"
+            )
+        data = await prisma.datasource.find_unique(where={"id": datasource_id})
+        asyncio.create_task(
+            run_vectorize_flow(
+                datasource=datasource,
+                options=datasource.vectorDb.options if datasource.vectorDb else {},
+                vector_db_provider=datasource.vectorDb.provider
+                if datasource.vectorDb
+                else None,
+            )
+        )
         return {"success": True, "data": data}
+    except HTTPException:
+        raise
     except Exception as e:
         handle_exception(e)
 
@@ -200,6 +267,7 @@ async def delete(datasource_id: str, api_user=Depends(get_current_api_user)):
                 else None,
             )
         )
+        await invalidate_datasource_agents(datasource_id)
         # deleting datasources and agentdatasources if there are not any errors
         await prisma.agentdatasource.delete_many(where={"datasourceId": datasource_id})
         await prisma.datasource.delete(where={"id": datasource_id})
@@ -0,0 +1,29 @@
+import json
+
+from fastapi import APIRouter, Depends
+
+from app.models.response import Job as JobResponse
+from app.utils.api import get_current_api_user, handle_exception
+from app.utils.prisma import prisma
+
+router = APIRouter()
+
+
+@router.get(
+    "/jobs/{job_id}",
+    name="get",
+    description="Get the status and result of an async invocation",
+    response_model=JobResponse,
+)
+async def get(job_id: str, api_user=Depends(get_current_api_user)):
+    """Endpoint for getting a single job"""
+    try:
+        data = await prisma.job.find_first(
+            where={"id": job_id, "apiUserId": api_user.id}
+        )
+        if data:
+            data.input = json.dumps(data.input)
+            data.output = json.dumps(data.output) if data.output else None
+        return {"success": True, "data": data}
+    except Exception as e:
+        handle_exception(e)
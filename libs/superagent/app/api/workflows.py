@@ -1,11 +1,11 @@
 import asyncio
-import json
+import itertools
 import logging
 from typing import AsyncIterable
 
 import segment.analytics as analytics
 from decouple import config
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response, status
 from fastapi.responses import StreamingResponse
 
 from app.models.request import (
@@ -21,10 +21,20 @@ from app.models.response import Workflow as WorkflowResponse
 from app.models.response import WorkflowList as WorkflowListResponse
 from app.models.response import WorkflowStep as WorkflowStepResponse
 from app.models.response import WorkflowStepList as WorkflowStepListResponse
+from app.utils.admission import AdmissionTicket, admit_invocation
 from app.utils.api import get_current_api_user, handle_exception
+from app.utils.jobs import create_job
 from app.utils.prisma import prisma
-from app.utils.streaming import CustomAsyncIteratorCallbackHandler
+from app.utils.streaming import (
+    CustomAsyncIteratorCallbackHandler,
+    StreamEvent,
+    format_sse,
+    merge_streams,
+    stream_tokens,
+)
 from app.workflows.base import WorkflowBase
+from app.workflows.loader import load_workflow_config
+from prisma.enums import JobType
 
 SEGMENT_WRITE_KEY = config("SEGMENT_WRITE_KEY", None)
 
@@ -151,21 +161,34 @@ async def delete(workflow_id: str, api_user=Depends(get_current_api_user)):
 async def invoke(
     workflow_id: str,
     body: WorkflowInvokeRequest,
+    response: Response,
     api_user=Depends(get_current_api_user),
+    _admission_ticket: AdmissionTicket = Depends(admit_invocation),
 ):
     """Endpoint for invoking a specific workflow"""
+    if body.mode == "async":
+        if SEGMENT_WRITE_KEY:
+            analytics.track(api_user.id, "Invoked Workflow Async")
+        job = await create_job(
+            api_user_id=api_user.id,
+            type=JobType.WORKFLOW,
+            input=body.dict(exclude={"mode", "webhookUrl"}),
+            workflow_id=workflow_id,
+            webhook_url=body.webhookUrl,
+        )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"success": True, "data": {"jobId": job.id}}
+
     if SEGMENT_WRITE_KEY:
         analytics.track(api_user.id, "Invoked Workflow")
 
-    workflowData = await prisma.workflow.find_unique(
-        where={"id": workflow_id},
-        include={"steps": {"include": {"agent": True}}},
-    )
+    workflowData = await load_workflow_config(workflow_id=workflow_id)
 
     workflowSteps = [
         {
             "callback": CustomAsyncIteratorCallbackHandler(),
             "agentName": workflowStep.agent.name,
+            "order": workflowStep.order,
         }
         for workflowStep in workflowData.steps
     ]
@@ -179,39 +202,63 @@ async def invoke(
         enable_streaming=enable_streaming,
         callbacks=[workflowStep["callback"] for workflowStep in workflowSteps],
         session_id=session_id,
+        join=body.join,
+        run_id=body.runId,
     )
 
     if enable_streaming:
         logging.info("Streaming enabled. Preparing streaming response...")
 
+        def end_streams(_task: asyncio.Future):
+            # A failed run leaves the streams of its remaining steps open
+            for workflowStep in workflowSteps:
+                workflowStep["callback"].done.set()
+
         async def send_message() -> AsyncIterable[str]:
+            task = asyncio.ensure_future(workflow.arun(input))
+            task.add_done_callback(end_streams)
             try:
-                task = asyncio.ensure_future(workflow.arun(input))
-                for workflowStep in workflowSteps:
-                    async for token in workflowStep["callback"].aiter():
-                        yield f"id: {workflowStep['agentName']}\ndata: {token}\n\n"
+                yield format_sse(
+                    StreamEvent(event="workflow_run", data={"runId": workflow.run_id})
+                )
+                # Steps sharing an order run concurrently, their tokens are
+                # interleaved and told apart by the agent name
+                for _, level in itertools.groupby(
+                    workflowSteps, key=lambda workflowStep: workflowStep["order"]
+                ):
+                    # `list` is shadowed by the endpoint of this module
+                    level = tuple(level)
+                    async for index, token in merge_streams(
+                        [
+                            stream_tokens(
+                                workflowStep["callback"],
+                                flush_interval_ms=body.streamFlushInterval,
+                                flush_bytes=body.streamFlushBytes,
+                            )
+                            for workflowStep in level
+                        ]
+                    ):
+                        yield format_sse(token, id=level[index]["agentName"])
                 await task
-                workflow_result = task.result()
-
-                for i in range(len(workflowSteps)):
-                    result = workflow_result.get("steps", {}).get(i, {})
-
-                    if "intermediate_steps" in result:
-                        for step in result["intermediate_steps"]:
-                            agent_action_message_log = step[0]
-                            function = agent_action_message_log.tool
-                            args = agent_action_message_log.tool_input
-                            if function and args:
-                                yield (
-                                    "event: function_call\n"
-                                    f'data: {{"function": "{function}", '
-                                    f'"args": {json.dumps(args)}}}\n\n'
-                                )
-
             except Exception as e:
                 logging.error(f"Error in send_message: {e}")
+                yield format_sse(
+                    StreamEvent(
+                        event="error",
+                        data={"runId": workflow.run_id, "message": str(e)},
+                    )
+                )
             finally:
-                workflowStep["callback"].done.set()
+                end_streams(task)
+                # Stop the remaining steps when the client disconnected
+                if not task.done():
+                    task.cancel()
+                    logging.warning(
+                        "Stream closed before completion, cancelled workflow "
+                        f"{workflow_id}"
+                    )
+                    if SEGMENT_WRITE_KEY:
+                        analytics.track(api_user.id, "Cancelled Workflow Invocation")
 
         generator = send_message()
         return StreamingResponse(generator, media_type="text/event-stream")
@@ -0,0 +1,398 @@
+import asyncio
+import codecs
+import hashlib
+import logging
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+import aiohttp
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+# Requests in flight per crawl, and per host of the crawled site
+CRAWLER_MAX_CONCURRENCY = config("CRAWLER_MAX_CONCURRENCY", 20, cast=int)
+CRAWLER_MAX_CONCURRENCY_PER_HOST = config(
+    "CRAWLER_MAX_CONCURRENCY_PER_HOST", 4, cast=int
+)
+# Seconds between the start of two requests to the same host
+CRAWLER_HOST_DELAY = config("CRAWLER_HOST_DELAY", 0.1, cast=float)
+CRAWLER_MAX_PAGES = config("CRAWLER_MAX_PAGES", 1000, cast=int)
+# Larger pages are skipped
+CRAWLER_MAX_PAGE_SIZE = config("CRAWLER_MAX_PAGE_SIZE", 5 * 1024 * 1024, cast=int)
+CRAWLER_PAGE_TIMEOUT = config("CRAWLER_PAGE_TIMEOUT", 20, cast=float)
+# Pages not fetched when a crawl runs longer are left out
+CRAWLER_MAX_CRAWL_TIME = config("CRAWLER_MAX_CRAWL_TIME", 600, cast=float)
+
+CRAWLER_USER_AGENT = "Mozilla/5.0 (compatible; SuperagentBot/1.0)"
+HTML_CONTENT_TYPES = ["text/html", "application/xhtml+xml"]
+TEXT_CONTENT_TYPES = [*HTML_CONTENT_TYPES, "text/plain"]
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Statuses of pages that no longer exist, other errors keep the known page
+GONE_STATUSES = [404, 410]
+
+
+def normalize_url(url: str) -> str:
+    """
+    Lowercases the scheme and host, drops default ports and fragments and sorts
+    the query, so the same page is crawled once. Raises ValueError for invalid
+    URLs, e.g. with a port that is not a number.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def _resolve_links(url: str, hrefs: List[str]) -> List[str]:
+    links = []
+    for href in hrefs:
+        try:
+            links.append(urljoin(url, href))
+        except ValueError:
+            # E.g. "http://[bad"
+            continue
+    return links
+
+
+def extract_html(
+    body: bytes, url: str, encoding: str = "utf-8"
+) -> Tuple[str, str, List[str]]:
+    """
+    Returns the text, title and absolute links of a page. The body is parsed as
+    bytes, lxml rejects text with an XML encoding declaration, e.g. of XHTML.
+    """
+    try:
+        import lxml.html
+    except ImportError:
+        lxml = None
+
+    if lxml is not None:
+        try:
+            parser = lxml.html.HTMLParser(encoding=encoding)
+            tree = lxml.html.fromstring(body, parser=parser)
+        except (LookupError, ValueError, lxml.etree.ParserError) as e:
+            logger.warning(f"Failed to extract the text of {url}: {e}")
+            return "", "", []
+        links = _resolve_links(url, tree.xpath("//a/@href"))
+        title = tree.findtext(".//title") or ""
+        for element in tree.xpath("//script|//style|//noscript"):
+            element.drop_tree()
+        return tree.text_content(), title.strip(), links
+
+    from bs4 import BeautifulSoup as Soup
+
+    soup = Soup(body, "html.parser", from_encoding=encoding)
+    links = _resolve_links(url, [a["href"] for a in soup.find_all("a", href=True)])
+    title = soup.title.get_text().strip() if soup.title else ""
+    for element in soup(["script", "style", "noscript"]):
+        element.decompose()
+    return soup.get_text(), title, links
+
+
+class CrawledPage:
+    def __init__(
+        self,
+        url: str,
+        text: str = "",
+        title: str = "",
+        links: Optional[List[str]] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        not_modified: bool = False,
+    ):
+        self.url = url
+        self.text = text
+        self.title = title
+        self.links = links or []
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = (
+            content_hash
+            if content_hash is not None
+            else hashlib.sha256(text.encode()).hexdigest()
+        )
+        # Unchanged since the known page passed to the crawl, `text` is empty
+        self.not_modified = not_modified
+
+
+class CrawlStats:
+    def __init__(self):
+        self.fetched = 0
+        self.not_modified = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+
+    @property
+    def pages_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return (self.fetched + self.not_modified) / elapsed if elapsed else 0.0
+
+
+class Crawler:
+    """
+    Crawls pages concurrently with a pooled aiohttp session. Requests are capped
+    globally and per host, where they are also spaced by `host_delay`. Pages are
+    deduplicated by normalized URL and by the hash of their text, pages over
+    `max_page_size` are skipped and the crawl stops after `max_crawl_time`.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = CRAWLER_MAX_CONCURRENCY,
+        max_concurrency_per_host: int = CRAWLER_MAX_CONCURRENCY_PER_HOST,
+        host_delay: float = CRAWLER_HOST_DELAY,
+        max_pages: int = CRAWLER_MAX_PAGES,
+        max_page_size: int = CRAWLER_MAX_PAGE_SIZE,
+        page_timeout: float = CRAWLER_PAGE_TIMEOUT,
+        max_crawl_time: float = CRAWLER_MAX_CRAWL_TIME,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.host_delay = host_delay
+        self.max_pages = max_pages
+        self.max_page_size = max_page_size
+        self.page_timeout = page_timeout
+        self.max_crawl_time = max_crawl_time
+        self.stats = CrawlStats()
+        # Set when pages were left out because of `max_pages` or `max_crawl_time`
+        self.truncated = False
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_request_at: Dict[str, float] = {}
+
+    async def _wait_for_host(self, host: str):
+        # Reserves the next slot of the host before sleeping, so concurrent
+        # requests line up behind each other
+        now = asyncio.get_event_loop().time()
+        request_at = max(now, self._next_request_at.get(host, now))
+        self._next_request_at[host] = request_at + self.host_delay
+        if request_at > now:
+            await asyncio.sleep(request_at - now)
+
+    async def _read(self, response: aiohttp.ClientResponse) -> Optional[bytes]:
+        if (response.content_length or 0) > self.max_page_size:
+            return None
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            body.extend(chunk)
+            if len(body) > self.max_page_size:
+                return None
+        return bytes(body)
+
+    def _get_known_page(self, url: str, known_page: dict) -> CrawledPage:
+        return CrawledPage(
+            url=url,
+            links=known_page.get("links"),
+            etag=known_page.get("etag"),
+            last_modified=known_page.get("lastModified"),
+            content_hash=known_page.get("hash"),
+            not_modified=True,
+        )
+
+    async def _fetch(
+        self,
+        session: aiohttp.ClientSession,
+        semaphore: asyncio.Semaphore,
+        url: str,
+        known_page: dict,
+    ) -> Optional[CrawledPage]:
+        host = urlsplit(url).netloc
+        host_semaphore = self._host_semaphores.setdefault(
+            host, asyncio.Semaphore(self.max_concurrency_per_host)
+        )
+        headers = {}
+        if known_page.get("etag"):
+            headers["If-None-Match"] = known_page["etag"]
+        if known_page.get("lastModified"):
+            headers["If-Modified-Since"] = known_page["lastModified"]
+
+        async with host_semaphore:
+            await self._wait_for_host(host)
+            async with semaphore:
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        if response.status == 304 and known_page:
+                            self.stats.not_modified += 1
+                            return self._get_known_page(url, known_page)
+                        if response.status in GONE_STATUSES:
+                            self.stats.skipped += 1
+                            return None
+                        # E.g. a 503 of a flaky server
+                        response.raise_for_status()
+                        content_type = response.content_type
+                        if content_type not in TEXT_CONTENT_TYPES:
+                            self.stats.skipped += 1
+                            return None
+                        body = await self._read(response)
+                        if body is None:
+                            logger.warning(f"Skipped {url}, larger than max page size")
+                            self.stats.skipped += 1
+                            return None
+                        encoding = response.charset or "utf-8"
+                        # Raises LookupError for an unknown charset
+                        codecs.lookup(encoding)
+                        etag = response.headers.get("ETag")
+                        last_modified = response.headers.get("Last-Modified")
+                except (aiohttp.ClientError, asyncio.TimeoutError, LookupError) as e:
+                    logger.warning(f"Failed to fetch {url}: {e}")
+                    self.stats.failed += 1
+                    # Kept as is until the next crawl
+                    return self._get_known_page(url, known_page) if known_page else None
+
+        self.stats.fetched += 1
+        if content_type in HTML_CONTENT_TYPES:
+            text, title, links = extract_html(body, url, encoding)
+        else:
+            text, title, links = body.decode(encoding, errors="replace"), "", []
+        return CrawledPage(
+            url=url,
+            text=text,
+            title=title,
+            links=links,
+            etag=etag,
+            last_modified=last_modified,
+        )
+
+    async def crawl(
+        self,
+        urls: List[str],
+        max_depth: int = 0,
+        base_url: Optional[str] = None,
+        known_pages: Optional[Dict[str, dict]] = None,
+    ) -> AsyncIterator[CrawledPage]:
+        """
+        Yields the pages at `urls` and, up to `max_depth` links away, the pages
+        they link to under `base_url`, in the order they are fetched. Known pages,
+        with the state stored by `DataLoader.iter_webpage_changes`, are fetched
+        conditionally.
+        """
+        known_pages = known_pages or {}
+        base_url = normalize_url(base_url) if base_url else None
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        deadline = time.perf_counter() + self.max_crawl_time
+        seen: Set[str] = set()
+        hashes: Set[str] = set()
+        pending: Dict[asyncio.Future, int] = {}
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency, limit_per_host=self.max_concurrency_per_host
+        )
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.page_timeout),
+            headers={"User-Agent": CRAWLER_USER_AGENT},
+        ) as session:
+
+            def schedule(url: str, depth: int):
+                try:
+                    url = normalize_url(url)
+                except ValueError:
+                    logger.warning(f"Skipped invalid URL {url}")
+                    return
+                if url in seen or (base_url and not url.startswith(base_url)):
+                    return
+                if len(seen) >= self.max_pages:
+                    self.truncated = True
+                    return
+                seen.add(url)
+                task = asyncio.ensure_future(
+                    self._fetch(session, semaphore, url, known_pages.get(url, {}))
+                )
+                pending[task] = depth
+
+            for url in urls:
+                schedule(url, 0)
+
+            try:
+                while pending:
+                    done, _ = await asyncio.wait(
+                        pending,
+                        timeout=max(deadline - time.perf_counter(), 0),
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    if not done:
+                        self.truncated = True
+                        logger.warning(
+                            f"Crawl stopped after {self.max_crawl_time}s, "
+                            f"{len(pending)} pages left out"
+                        )
+                        break
+                    for task in done:
+                        depth = pending.pop(task)
+                        page = task.result()
+                        if page is None:
+                            continue
+                        if depth < max_depth:
+                            for link in page.links:
+                                schedule(link, depth + 1)
+                        if page.content_hash in hashes:
+                            self.stats.duplicates += 1
+                            continue
+                        if page.content_hash:
+                            hashes.add(page.content_hash)
+                        yield page
+            finally:
+                for task in pending:
+                    task.cancel()
+                logger.info(
+                    f"Crawled {self.stats.fetched} pages, {self.stats.not_modified} "
+                    f"unchanged, {self.stats.duplicates} duplicates, "
+                    f"{self.stats.skipped} skipped, {self.stats.failed} failed at "
+                    f"{self.stats.pages_per_second:.1f} pages/sec"
+                )
+
+
+def crawl(
+    urls: List[str], crawler: Optional[Crawler] = None, **kwargs
+) -> Iterator[CrawledPage]:
+    """
+    Runs a crawl in an event loop of its own thread and yields its pages, for
+    the loaders in the ingestion pool. The crawl goes on while the caller
+    processes a page, up to CRAWLER_MAX_CONCURRENCY pages ahead.
+    """
+    crawler = crawler or Crawler()
+    pages: queue.Queue = queue.Queue(maxsize=CRAWLER_MAX_CONCURRENCY)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        # Waits for room in the queue unless the caller went away
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def run():
+        loop = asyncio.get_event_loop()
+        try:
+            async for page in crawler.crawl(urls, **kwargs):
+                if not await loop.run_in_executor(None, put, page):
+                    return
+        except Exception as e:
+            put(e)
+        put(None)
+
+    thread = threading.Thread(target=asyncio.run, args=(run(),), daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
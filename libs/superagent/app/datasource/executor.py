@@ -0,0 +1,222 @@
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import SyncManager
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+from decouple import config
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.datasource.loader import DataLoader
+from app.datasource.pdf import shutdown_pdf_executor
+from prisma.models import Datasource
+
+logger = logging.getLogger(__name__)
+
+# Number of processes loading and parsing datasources per API worker
+INGESTION_WORKERS = config("INGESTION_WORKERS", 2, cast=int)
+# Chunks per embedding batch, and batches buffered ahead of the embedding
+INGESTION_BATCH_SIZE = config("INGESTION_BATCH_SIZE", 100, cast=int)
+INGESTION_QUEUE_SIZE = config("INGESTION_QUEUE_SIZE", 4, cast=int)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_manager: Optional[SyncManager] = None
+
+
+def _init_ingestion_worker():
+    # Each ingestion worker starts its own PDF pool, stopped when it exits
+    atexit.register(shutdown_pdf_executor)
+
+
+def get_ingestion_executor() -> ProcessPoolExecutor:
+    """
+    Process pool for datasource loading, which downloads, clones and parses
+    files and would otherwise block the event loop of the API worker.
+    """
+    global _executor
+    if _executor is None:
+        # Forking would copy the event loop and the Prisma engine connection
+        _executor = ProcessPoolExecutor(
+            max_workers=INGESTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ingestion_worker,
+        )
+        logger.info(f"Started ingestion pool with {INGESTION_WORKERS} workers")
+    return _executor
+
+
+def _get_manager() -> SyncManager:
+    """Serves the queues between the ingestion pool and the API worker"""
+    global _manager
+    if _manager is None:
+        _manager = multiprocessing.get_context("spawn").Manager()
+    return _manager
+
+
+def shutdown_ingestion_executor():
+    global _executor, _manager
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
+
+
+def load_datasource(datasource: Datasource) -> List[Document]:
+    """Runs in the ingestion pool"""
+    return DataLoader(datasource=datasource).load()
+
+
+def _put(chunk_queue: Any, stop: Any, item: Tuple[str, Any]) -> bool:
+    # Waits for room in the queue unless the consumer went away
+    while not stop.is_set():
+        try:
+            chunk_queue.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def produce_chunks(
+    datasource: Datasource, chunk_queue: Any, stop: Any, batch_size: int
+) -> None:
+    """Runs in the ingestion pool, puts batches of chunks on the queue"""
+    try:
+        batch = []
+        for chunk in DataLoader(datasource=datasource).iter_chunks():
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                if not _put(chunk_queue, stop, ("chunks", batch)):
+                    return
+                batch = []
+        if batch and not _put(chunk_queue, stop, ("chunks", batch)):
+            return
+        _put(chunk_queue, stop, ("done", None))
+    except Exception as e:
+        _put(chunk_queue, stop, ("error", str(e)))
+
+
+def produce_changes(
+    datasource: Datasource,
+    sync_state: Optional[dict],
+    chunk_queue: Any,
+    stop: Any,
+    batch_size: int,
+) -> None:
+    """
+    Runs in the ingestion pool, puts batches of deleted sources and new chunks
+    on the queue, see `DataLoader.iter_changes`. The vectors of the deleted
+    sources are removed before the chunks of the same batch are added.
+    """
+    # Same splitter as `load_and_split`
+    text_splitter = RecursiveCharacterTextSplitter()
+    try:
+        changes = DataLoader(datasource=datasource).iter_changes(sync_state)
+        deleted, batch = [], []
+        state = None
+        for kind, payload in changes:
+            if kind == "reset":
+                if not _put(chunk_queue, stop, ("reset", None)):
+                    return
+            elif kind == "delete":
+                deleted.append(payload)
+            elif kind == "document":
+                batch.extend(text_splitter.split_documents([payload]))
+            elif kind == "state":
+                state = payload
+            if len(batch) >= batch_size or len(deleted) >= batch_size:
+                if not _put(chunk_queue, stop, ("changes", (deleted, batch))):
+                    return
+                deleted, batch = [], []
+        if (deleted or batch) and not _put(
+            chunk_queue, stop, ("changes", (deleted, batch))
+        ):
+            return
+        _put(chunk_queue, stop, ("done", state))
+    except Exception as e:
+        _put(chunk_queue, stop, ("error", str(e)))
+
+
+async def _consume(
+    producer_fn: Callable[..., None], *args: Any
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Runs a producer in the ingestion pool and yields what it puts on the queue,
+    up to and including its ("done", ...) item. At most INGESTION_QUEUE_SIZE
+    items are buffered, so the producer waits for slow consumers and memory
+    use does not grow with the size of the datasource.
+    """
+    loop = asyncio.get_event_loop()
+    manager = _get_manager()
+    chunk_queue = manager.Queue(maxsize=INGESTION_QUEUE_SIZE)
+    stop = manager.Event()
+    producer = loop.run_in_executor(
+        get_ingestion_executor(),
+        producer_fn,
+        *args,
+        chunk_queue,
+        stop,
+        INGESTION_BATCH_SIZE,
+    )
+
+    def get_item() -> Optional[Tuple[str, Any]]:
+        try:
+            return chunk_queue.get(timeout=1)
+        except queue.Empty:
+            return None
+
+    try:
+        producer_done = False
+        while True:
+            item = await loop.run_in_executor(None, get_item)
+            if item is None:
+                if producer_done:
+                    # The producer ended without reporting, e.g. killed by the OS
+                    producer.result()
+                    raise Exception("Datasource loading stopped unexpectedly")
+                # A finished producer has put its last item, read once more
+                producer_done = producer.done()
+                continue
+            kind, payload = item
+            if kind == "error":
+                raise Exception(payload)
+            yield item
+            if kind == "done":
+                return
+    finally:
+        stop.set()
+
+
+async def iter_chunk_batches(datasource: Datasource) -> AsyncIterator[List[Document]]:
+    """
+    Loads a datasource in the ingestion pool and yields its chunks in batches as
+    they are loaded.
+    """
+    items = _consume(produce_chunks, datasource)
+    try:
+        async for kind, payload in items:
+            if kind == "chunks":
+                yield payload
+    finally:
+        await items.aclose()
+
+
+async def iter_changes(
+    datasource: Datasource, sync_state: Optional[dict]
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Syncs a datasource in the ingestion pool and yields ("reset", None),
+    ("changes", (deleted sources, chunks)) and finally ("done", new sync state).
+    """
+    items = _consume(produce_changes, datasource, sync_state)
+    try:
+        async for item in items:
+            yield item
+    finally:
+        await items.aclose()
@@ -1,13 +1,21 @@
+import asyncio
+from functools import partial
 from typing import List, Optional
 
 from decouple import config
 from llama import Context, LLMEngine, Type
 from prefect import flow, task
 
-from app.datasource.loader import DataLoader
-from app.datasource.types import VALID_UNSTRUCTURED_DATA_TYPES
+from app.datasource.executor import (
+    get_ingestion_executor,
+    iter_changes,
+    iter_chunk_batches,
+    load_datasource,
+)
+from app.datasource.types import SYNCABLE_DATA_TYPES, VALID_UNSTRUCTURED_DATA_TYPES
 from app.utils.prisma import prisma
 from app.vectorstores.base import VectorStoreBase
+from prisma import Json
 from prisma.enums import DatasourceStatus
 from prisma.models import AgentDatasource, Datasource
 
@@ -27,9 +35,12 @@ async def handle_datasources(
         model_name="chat/gpt-3.5-turbo",
     )
     llm.clear_data()
+    loop = asyncio.get_event_loop()
     for agent_datasource in agent_datasources:
         if agent_datasource.datasource.type in VALID_UNSTRUCTURED_DATA_TYPES:
-            data = DataLoader(agent_datasource.datasource).load()
+            data = await loop.run_in_executor(
+                get_ingestion_executor(), load_datasource, agent_datasource.datasource
+            )
             documents = [
                 Document(text=document.page_content, metadata=document.metadata)
                 for document in data
@@ -37,20 +48,60 @@ async def handle_datasources(
             llm.save_data(documents)
 
 
+async def sync_vectors(vector_store: VectorStoreBase, datasource: Datasource):
+    """
+    Replaces the vectors of the sources that changed since the last sync and
+    stores the new sync state once all of them are replaced
+    """
+    loop = asyncio.get_event_loop()
+    async for kind, payload in iter_changes(datasource, datasource.syncState):
+        if kind == "reset":
+            await loop.run_in_executor(
+                None, partial(vector_store.delete, datasource_id=datasource.id)
+            )
+        elif kind == "changes":
+            deleted, documents = payload
+            if deleted:
+                await loop.run_in_executor(
+                    None,
+                    partial(
+                        vector_store.delete_sources,
+                        datasource_id=datasource.id,
+                        sources=deleted,
+                    ),
+                )
+            for document in documents:
+                document.metadata["datasource_id"] = datasource.id
+            if documents:
+                await loop.run_in_executor(
+                    None, partial(vector_store.embed_documents, documents=documents)
+                )
+        elif kind == "done":
+            await prisma.datasource.update(
+                where={"id": datasource.id}, data={"syncState": Json(payload)}
+            )
+
+
 @task
 async def vectorize(
     datasource: Datasource, options: Optional[dict], vector_db_provider: Optional[str]
 ) -> None:
-    data = DataLoader(datasource=datasource).load()
-    newDocuments = [
-        document.metadata.update({"datasource_id": datasource.id}) or document
-        for document in data
-    ]
-
     vector_store = VectorStoreBase(
         options=options, vector_db_provider=vector_db_provider
     )
-    vector_store.embed_documents(documents=newDocuments)
+    if datasource.type in SYNCABLE_DATA_TYPES:
+        await sync_vectors(vector_store=vector_store, datasource=datasource)
+        return
+
+    # Chunks are loaded in the ingestion pool while earlier batches are embedded
+    # in a thread, neither blocks the event loop
+    loop = asyncio.get_event_loop()
+    async for documents in iter_chunk_batches(datasource):
+        for document in documents:
+            document.metadata["datasource_id"] = datasource.id
+        await loop.run_in_executor(
+            None, partial(vector_store.embed_documents, documents=documents)
+        )
 
 
 @task
@@ -60,7 +111,10 @@ async def handle_delete_datasource(
     vector_store = VectorStoreBase(
         options=options, vector_db_provider=vector_db_provider
     )
-    vector_store.delete(datasource_id=datasource_id)
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(
+        None, partial(vector_store.delete, datasource_id=datasource_id)
+    )
 
 
 @flow(name="process_datasource", description="Process new agent datasource", retries=0)
@@ -1,27 +1,35 @@
+import base64
+import binascii
 import json
+import logging
+import os
 import tempfile
 from tempfile import NamedTemporaryFile
-from typing import Any
+from typing import Any, Iterator, Optional, Tuple
 from urllib.parse import urlparse
 
 import requests
-from bs4 import BeautifulSoup as Soup
 from langchain.docstore.document import Document
 from langchain.document_loaders import (
     GitLoader,
-    PyPDFLoader,
-    RecursiveUrlLoader,
     TextLoader,
     UnstructuredMarkdownLoader,
     UnstructuredWordDocumentLoader,
-    WebBaseLoader,
     YoutubeLoader,
 )
 from langchain.document_loaders.airbyte import AirbyteStripeLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 from pyairtable import Api
 
+from app.datasource.crawler import CrawledPage, Crawler, crawl
+from app.datasource.pdf import parse_pdf
 from prisma.models import Datasource
 
+logger = logging.getLogger(__name__)
+
+# Same pages as `RecursiveUrlLoader` with `max_depth=2`, the page and its links
+WEBPAGE_MAX_DEPTH = 1
+
 
 class DataLoader:
     def __init__(self, datasource: Datasource):
@@ -55,6 +63,28 @@ class DataLoader:
         else:
             raise ValueError(f"Unsupported datasource type: {self.datasource.type}")
 
+    def iter_chunks(self) -> Iterator[Document]:
+        """
+        Yields the chunks of the datasource as they are loaded, so large sources
+        are never held in memory at once. Types that are a single file fall back
+        to `load`.
+        """
+        lazy_loaders = {
+            "PDF": self.lazy_load_pdf,
+            "GITHUB_REPOSITORY": self.lazy_load_github,
+            "WEBPAGE": self.lazy_load_webpage,
+            "URL": self.lazy_load_url,
+        }
+        lazy_load = lazy_loaders.get(self.datasource.type)
+        if lazy_load is None:
+            yield from self.load()
+            return
+
+        # Same splitter as `load_and_split`
+        text_splitter = RecursiveCharacterTextSplitter()
+        for document in lazy_load():
+            yield from text_splitter.split_documents([document])
+
     def load_txt(self):
         with NamedTemporaryFile(suffix=".txt", delete=True) as temp_file:
             if self.datasource.url:
@@ -67,15 +97,34 @@ class DataLoader:
             return loader.load_and_split()
 
     def load_pdf(self):
-        if self.datasource.url:
-            loader = PyPDFLoader(file_path=self.datasource.url)
-        else:
-            with NamedTemporaryFile(suffix=".pdf", delete=True) as temp_file:
-                temp_file.write(self.datasource.content)
-                temp_file.flush()
-                loader = UnstructuredWordDocumentLoader(file_path=temp_file.name)
-                return loader.load_and_split()
-        return loader.load_and_split()
+        return RecursiveCharacterTextSplitter().split_documents(
+            list(self.lazy_load_pdf())
+        )
+
+    def lazy_load_pdf(self) -> Iterator[Document]:
+        """Pages of the PDF in order, parsed in parallel"""
+        with NamedTemporaryFile(suffix=".pdf", delete=True) as temp_file:
+            if self.datasource.url:
+                with requests.get(self.datasource.url, stream=True) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        temp_file.write(chunk)
+                source = self.datasource.url
+            else:
+                temp_file.write(self._get_content_bytes())
+                source = self.datasource.name
+            temp_file.flush()
+            # The workers read the pages they parse from the file
+            yield from parse_pdf(file_path=temp_file.name, source=source)
+
+    def _get_content_bytes(self) -> bytes:
+        """Binary files uploaded as `content` are base64 encoded"""
+        content = self.datasource.content or ""
+        try:
+            return base64.b64decode(content, validate=True)
+        except binascii.Error:
+            # Stored as text
+            return content.encode()
 
     def load_google_doc(self):
         pass
@@ -136,17 +185,174 @@ class DataLoader:
             )
             return loader.load_and_split()
 
+    def _clone_github(self, temp_dir: str) -> Any:
+        from git import Repo
+
+        metadata = json.loads(self.datasource.metadata)
+        repo = Repo.clone_from(self.datasource.url, temp_dir)
+        repo.git.checkout(metadata["branch"])
+        return repo
+
+    def _load_github_file(self, repo: Any, path: str) -> Optional[Document]:
+        """Same document as `GitLoader` for a file, None for non-text files"""
+        file_path = os.path.join(repo.working_tree_dir, path)
+        if not os.path.isfile(file_path) or repo.ignored([file_path]):
+            return None
+        with open(file_path, "rb") as f:
+            content = f.read()
+        # Only text files are loaded
+        try:
+            text_content = content.decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+        file_name = os.path.basename(path)
+        return Document(
+            page_content=text_content,
+            metadata={
+                "source": path,
+                "file_path": path,
+                "file_name": file_name,
+                "file_type": os.path.splitext(file_name)[1],
+            },
+        )
+
+    def lazy_load_github(self) -> Iterator[Document]:
+        """Same documents as `GitLoader`, read one file at a time"""
+        from git import Blob
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo = self._clone_github(temp_dir)
+            for item in repo.tree().traverse():
+                if not isinstance(item, Blob):
+                    continue
+                document = self._load_github_file(repo, item.path)
+                if document is not None:
+                    yield document
+
+    def iter_github_changes(self, state: dict) -> Iterator[Tuple[str, Any]]:
+        """
+        Loads the files changed since the last synced commit, see `iter_changes`.
+        Without a usable last commit, e.g. after a force push, the whole
+        repository is loaded again.
+        """
+        from git import Blob
+        from git.exc import BadName, GitCommandError
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo = self._clone_github(temp_dir)
+            head = repo.head.commit
+            last_commit = state.get("lastCommit")
+            try:
+                diffs = repo.commit(last_commit).diff(head) if last_commit else None
+            except (BadName, GitCommandError, ValueError):
+                # A full hash is only looked up once diffed
+                logger.warning(f"Commit {last_commit} not found, loading all files")
+                diffs = None
+
+            if diffs is None:
+                yield "reset", None
+                for item in head.tree.traverse():
+                    if isinstance(item, Blob):
+                        document = self._load_github_file(repo, item.path)
+                        if document is not None:
+                            yield "document", document
+            else:
+                logger.info(f"{len(diffs)} files changed since commit {last_commit}")
+                for diff in diffs:
+                    # Renamed files are deleted under the old path and added
+                    # under the new one
+                    if diff.a_path and not diff.new_file:
+                        yield "delete", diff.a_path
+                    if diff.b_path and not diff.deleted_file:
+                        # Also for new files, in case a failed sync added them
+                        if diff.renamed_file or diff.new_file:
+                            yield "delete", diff.b_path
+                        document = self._load_github_file(repo, diff.b_path)
+                        if document is not None:
+                            yield "document", document
+            yield "state", {"lastCommit": head.hexsha}
+
+    def _get_page_document(self, page: CrawledPage) -> Document:
+        return Document(
+            page_content=page.text, metadata={"source": page.url, "title": page.title}
+        )
+
     def load_webpage(self):
-        loader = RecursiveUrlLoader(
-            url=self.datasource.url,
-            max_depth=2,
-            extractor=lambda x: Soup(x, "html.parser").text,
+        return RecursiveCharacterTextSplitter().split_documents(
+            list(self.lazy_load_webpage())
         )
-        chunks = loader.load_and_split()
-        for chunk in chunks:
-            if "language" in chunk.metadata:
-                del chunk.metadata["language"]
-        return chunks
+
+    def lazy_load_webpage(self) -> Iterator[Document]:
+        for page in crawl(
+            [self.datasource.url],
+            max_depth=WEBPAGE_MAX_DEPTH,
+            base_url=self.datasource.url,
+        ):
+            yield self._get_page_document(page)
+
+    def iter_webpage_changes(self, state: dict) -> Iterator[Tuple[str, Any]]:
+        """
+        Crawls the same pages as `load_webpage` and loads the ones whose content
+        changed since the last sync, see `iter_changes`. Unchanged pages are not
+        downloaded again when the server honours ETag or Last-Modified.
+        """
+        pages = state.get("pages", {})
+        synced_pages = {}
+        crawler = Crawler()
+        for page in crawl(
+            [self.datasource.url],
+            crawler=crawler,
+            max_depth=WEBPAGE_MAX_DEPTH,
+            base_url=self.datasource.url,
+            known_pages=pages,
+        ):
+            synced_pages[page.url] = {
+                "etag": page.etag,
+                "lastModified": page.last_modified,
+                "hash": page.content_hash,
+                "links": page.links,
+            }
+            known_page = pages.get(page.url, {})
+            if page.not_modified or page.content_hash == known_page.get("hash"):
+                continue
+            # Also for new pages, in case a failed sync added them already
+            if pages:
+                yield "delete", page.url
+            yield "document", self._get_page_document(page)
+
+        removed = [url for url in pages if url not in synced_pages]
+        if crawler.truncated:
+            # Pages left out of a partial crawl may still exist
+            synced_pages = {**{url: pages[url] for url in removed}, **synced_pages}
+        else:
+            for url in removed:
+                yield "delete", url
+        logger.info(
+            f"Synced {len(synced_pages)} pages of {self.datasource.url}, "
+            f"{len(removed)} not found"
+        )
+        yield "state", {"pages": synced_pages}
+
+    def iter_changes(self, state: Optional[dict]) -> Iterator[Tuple[str, Any]]:
+        """
+        Yields what changed in the datasource since the state of the last sync:
+        ("reset", None) when all vectors of the datasource are replaced,
+        ("delete", source) for sources whose vectors are removed, before their
+        new chunks, ("document", document) for new or changed documents and
+        finally ("state", state) to store for the next sync.
+        """
+        if self.datasource.type == "GITHUB_REPOSITORY":
+            changes = self.iter_github_changes(state or {})
+        elif self.datasource.type == "WEBPAGE":
+            changes = self.iter_webpage_changes(state or {})
+        else:
+            raise ValueError(f"Datasource type {self.datasource.type} can't be synced")
+        if not state:
+            # Clears whatever an earlier, failed ingestion left behind
+            yield "reset", None
+        for kind, payload in changes:
+            if kind != "reset" or state:
+                yield kind, payload
 
     def load_youtube(self):
         video_id = self.datasource.url.split("youtube.com/watch?v=")[-1]
@@ -154,9 +360,14 @@ class DataLoader:
         return loader.load_and_split()
 
     def load_url(self):
+        return RecursiveCharacterTextSplitter().split_documents(
+            list(self.lazy_load_url())
+        )
+
+    def lazy_load_url(self) -> Iterator[Document]:
         url_list = self.datasource.url.split(",")
-        loader = WebBaseLoader(url_list)
-        return loader.load_and_split()
+        for page in crawl(url_list):
+            yield self._get_page_document(page)
 
     def load_airtable(self):
         metadata = json.loads(self.datasource.metadata)
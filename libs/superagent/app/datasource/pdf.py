@@ -0,0 +1,127 @@
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from decouple import config
+from langchain.docstore.document import Document
+
+logger = logging.getLogger(__name__)
+
+# Processes parsing the pages of a PDF, per ingestion worker
+PDF_WORKERS = config("PDF_WORKERS", 4, cast=int)
+# Pages parsed per task, PDFs with fewer pages are parsed without the pool
+PDF_PAGES_PER_TASK = config("PDF_PAGES_PER_TASK", 25, cast=int)
+# Address space of a PDF worker in MB, 0 disables the limit
+PDF_WORKER_MEMORY_LIMIT = config("PDF_WORKER_MEMORY_LIMIT", 1024, cast=int)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _limit_memory(limit: int):
+    """Runs in each PDF worker, a page that needs more fails with MemoryError"""
+    if not limit:
+        return
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return
+    limit_bytes = limit * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_limit_memory,
+            initargs=(PDF_WORKER_MEMORY_LIMIT,),
+        )
+    return _executor
+
+
+def shutdown_pdf_executor():
+    """Runs when an ingestion worker exits, see `get_ingestion_executor`"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def parse_pages(file_path: str, source: str, start: int, end: int) -> List[Document]:
+    """
+    Parses pages `start` to `end` of a PDF, with the same metadata as
+    `PyPDFLoader`. Runs in the PDF workers.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    return [
+        Document(
+            page_content=reader.pages[page].extract_text(),
+            metadata={"source": source, "page": page},
+        )
+        for page in range(start, min(end, len(reader.pages)))
+    ]
+
+
+def parse_pdf(file_path: str, source: str) -> Iterator[Document]:
+    """
+    Yields the pages of a PDF in order. Ranges of PDF_PAGES_PER_TASK pages are
+    parsed in parallel by PDF_WORKERS processes, up to two ranges per worker
+    ahead of the caller so parsed pages don't pile up in memory.
+    """
+    global _executor
+    from pypdf import PdfReader
+
+    page_count = len(PdfReader(file_path).pages)
+    if page_count <= PDF_PAGES_PER_TASK or PDF_WORKERS <= 1:
+        yield from parse_pages(file_path, source, 0, page_count)
+        return
+
+    executor = get_pdf_executor()
+    starts = iter(range(0, page_count, PDF_PAGES_PER_TASK))
+    futures: Deque[Tuple[int, Future]] = deque()
+
+    def submit():
+        start = next(starts, None)
+        if start is not None:
+            future = executor.submit(
+                parse_pages, file_path, source, start, start + PDF_PAGES_PER_TASK
+            )
+            futures.append((start, future))
+
+    logger.info(
+        f"Parsing {page_count} pages of {source} in tasks of {PDF_PAGES_PER_TASK} "
+        f"pages on {PDF_WORKERS} workers"
+    )
+    for _ in range(PDF_WORKERS * 2):
+        submit()
+    try:
+        while futures:
+            start, future = futures.popleft()
+            try:
+                pages = future.result()
+            except MemoryError:
+                end = min(start + PDF_PAGES_PER_TASK, page_count)
+                raise MemoryError(
+                    f"Pages {start + 1} to {end} of {source} need more than "
+                    f"{PDF_WORKER_MEMORY_LIMIT}MB to parse"
+                )
+            except BrokenProcessPool:
+                # A worker was killed, e.g. by the OOM killer, start a new pool
+                # for the next PDF
+                executor.shutdown(wait=False)
+                _executor = None
+                raise
+            # Keeps the workers busy while the caller processes the pages
+            submit()
+            yield from pages
+    finally:
+        for _, future in futures:
+            future.cancel()
@@ -13,3 +13,6 @@ VALID_UNSTRUCTURED_DATA_TYPES = [
 ]
 
 VALID_STRUCTURED_DATA_TYPES = ["AIRTABLE", "CSV", "STRIPE", "XLSX"]
+
+# Re-ingested incrementally, only changed sources are embedded again
+SYNCABLE_DATA_TYPES = ["GITHUB_REPOSITORY", "WEBPAGE"]
@@ -5,7 +5,9 @@ import colorlog
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.datasource.executor import shutdown_ingestion_executor
 from app.routers import router
+from app.utils.jobs import job_runner
 from app.utils.prisma import prisma
 
 # Create a color formatter
@@ -60,11 +62,14 @@ async def add_process_time_header(request: Request, call_next):
 @app.on_event("startup")
 async def startup():
     await prisma.connect()
+    await job_runner.resume()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    job_runner.shutdown()
     await prisma.disconnect()
+    shutdown_ingestion_executor()
 
 
 app.include_router(router)
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel
 
@@ -32,12 +32,28 @@ class AgentInvoke(BaseModel):
     sessionId: Optional[str]
     enableStreaming: bool
     outputSchema: Optional[str]
+    # Coalesce streamed tokens into fewer SSE frames, flushed at the latest
+    # after `streamFlushInterval` milliseconds or once `streamFlushBytes` is reached
+    streamFlushInterval: Optional[int]
+    streamFlushBytes: Optional[int]
+    # `async` returns a job right away, poll it on `/jobs/{job_id}` or get its
+    # result posted to `webhookUrl`
+    mode: Literal["sync", "async"] = "sync"
+    webhookUrl: Optional[str]
+
+
+class AgentInvokeBatch(BaseModel):
+    inputs: List[str]
+    outputSchema: Optional[str]
+    # Number of inputs invoked at the same time
+    concurrency: int = 5
 
 
 class Datasource(BaseModel):
     name: str
     description: str
     type: str
+    # Base64 encoded for binary files, e.g. PDF
     content: Optional[str]
     url: Optional[str]
     metadata: Optional[Dict[Any, Any]]
@@ -70,12 +86,29 @@ class Workflow(BaseModel):
 class WorkflowStep(BaseModel):
     order: int
     agentId: str
+    # Run the agent once per element when the step input is a JSON list, at
+    # most `mapConcurrency` elements at a time
+    mapInput: bool = False
+    mapConcurrency: int = 5
+    # Reuse the output of an earlier run of the step on the same input, for
+    # steps whose output only depends on their input
+    memoize: bool = False
 
 
 class WorkflowInvoke(BaseModel):
     input: str
     enableStreaming: bool
     sessionId: Optional[str]
+    streamFlushInterval: Optional[int]
+    streamFlushBytes: Optional[int]
+    mode: Literal["sync", "async"] = "sync"
+    webhookUrl: Optional[str]
+    # Merge of the outputs of steps sharing an order: joined by blank lines, or
+    # a JSON object keyed by agent name
+    join: Literal["concatenate", "json"] = "concatenate"
+    # Resume a failed or cancelled run from its first incomplete step, the input
+    # of the run is used instead of `input`
+    runId: Optional[str]
 
 
 class VectorDb(BaseModel):
@@ -20,6 +20,9 @@ from prisma.models import (
 from prisma.models import (
     Datasource as DatasourceModel,
 )
+from prisma.models import (
+    Job as JobModel,
+)
 from prisma.models import (
     Tool as ToolModel,
 )
@@ -141,3 +144,8 @@ class VectorDb(BaseModel):
 class VectorDbList(BaseModel):
     success: bool
     data: Optional[List[VectorDbModel]]
+
+
+class Job(BaseModel):
+    success: bool
+    data: Optional[JobModel]
@@ -1,6 +1,15 @@
 from fastapi import APIRouter
 
-from app.api import agents, api_user, datasources, llms, tools, vector_dbs, workflows
+from app.api import (
+    agents,
+    api_user,
+    datasources,
+    jobs,
+    llms,
+    tools,
+    vector_dbs,
+    workflows,
+)
 
 router = APIRouter()
 api_prefix = "/api/v1"
@@ -12,3 +21,4 @@ router.include_router(datasources.router, tags=["Datasource"], prefix=api_prefix
 router.include_router(tools.router, tags=["Tool"], prefix=api_prefix)
 router.include_router(workflows.router, tags=["Workflow"], prefix=api_prefix)
 router.include_router(vector_dbs.router, tags=["Vector Database"], prefix=api_prefix)
+router.include_router(jobs.router, tags=["Job"], prefix=api_prefix)
@@ -1,4 +1,5 @@
 # flake8: noqa
+import asyncio
 import requests
 import pandas as pd
 
@@ -9,6 +10,7 @@ from langchain.tools import BaseTool
 from llama import Context, LLMEngine, Type
 from app.vectorstores.base import VectorStoreBase
 from app.datasource.loader import DataLoader
+from app.utils.prisma import prisma
 from prisma.models import Datasource
 
 from langchain.agents.agent_types import AgentType
@@ -134,7 +136,8 @@ class StructuredDatasourceTool(BaseTool):
         question: str,
     ) -> str:
         """Use the tool."""
-        datasource: Datasource = self.metadata["datasource"]
+        # Only called without a running event loop, e.g. in an executor thread
+        datasource: Datasource = asyncio.run(self._get_datasource())
         if datasource.type == "CSV":
             df = self._load_csv_data(datasource)
         elif datasource.type == "XLSX":
@@ -155,12 +158,22 @@ class StructuredDatasourceTool(BaseTool):
         output = agent.run(question)
         return output
 
+    async def _get_datasource(self) -> Datasource:
+        """
+        Datasources are passed in without their `content` column, fetch it only
+        when this tool actually runs on an uploaded file.
+        """
+        datasource = self.metadata["datasource"]
+        if datasource.url or datasource.type not in ["CSV", "XLSX"]:
+            return datasource
+        return await prisma.datasource.find_unique_or_raise(where={"id": datasource.id})
+
     async def _arun(
         self,
         question: str,
     ) -> str:
         """Use the tool asynchronously."""
-        datasource: Datasource = self.metadata["datasource"]
+        datasource: Datasource = await self._get_datasource()
         if datasource.type == "CSV":
             df = self._load_csv_data(datasource)
         elif datasource.type == "XLSX":
@@ -0,0 +1,229 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import Counter
+from typing import AsyncIterator, Dict, List
+
+from decouple import config
+from fastapi import Depends, HTTPException, status
+
+from app.utils.api import get_current_api_user
+
+logger = logging.getLogger(__name__)
+
+# 0 disables a limit, admission control is off when both limits are disabled
+ADMISSION_MAX_CONCURRENCY = config("ADMISSION_MAX_CONCURRENCY", 0, cast=int)
+ADMISSION_MAX_CONCURRENCY_PER_USER = config(
+    "ADMISSION_MAX_CONCURRENCY_PER_USER", 0, cast=int
+)
+ADMISSION_MAX_QUEUE_SIZE = config("ADMISSION_MAX_QUEUE_SIZE", 100, cast=int)
+# Share of the queue each API user gets, e.g. {"<api_user_id>": 2}, default 1
+ADMISSION_WEIGHTS = config("ADMISSION_WEIGHTS", "{}", cast=json.loads)
+
+
+class AdmissionStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.queued = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def average_wait_time(self) -> float:
+        return self.wait_time / self.queued if self.queued else 0.0
+
+
+class _Waiter:
+    def __init__(self, api_user_id: str, tag: float, sequence: int):
+        self.api_user_id = api_user_id
+        self.tag = tag
+        self.sequence = sequence
+        self.future: asyncio.Future = asyncio.get_event_loop().create_future()
+
+
+class AdmissionTicket:
+    """A slot of a running invocation"""
+
+    def __init__(self, controller: "AdmissionController", api_user_id: str):
+        self.controller = controller
+        self.api_user_id = api_user_id
+        self.wait_time = 0.0
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(self.api_user_id)
+
+    def get_server_timing(self) -> str:
+        return f"admission;dur={self.wait_time * 1000:.1f}"
+
+
+class AdmissionController:
+    """
+    Limits the invocations running at the same time, globally and per API user.
+    Invocations over a limit wait in a bounded queue ordered by weighted fair
+    queuing, so a busy user gets its share of the slots without starving the
+    others. Invocations are rejected with a 429 when the queue is full.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_concurrency_per_user: int,
+        max_queue_size: int,
+        weights: Dict[str, float],
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_user = max_concurrency_per_user
+        self.max_queue_size = max_queue_size
+        self.weights = weights
+        self.stats = AdmissionStats()
+        self.running = 0
+        self._running_per_user: Counter = Counter()
+        self._queue: List[_Waiter] = []
+        self._sequence = itertools.count()
+        # Weighted fair queuing tags, see `_get_tag`
+        self._virtual_time = 0.0
+        self._last_tags: Dict[str, float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0 or self.max_concurrency_per_user > 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _can_run(self, api_user_id: str) -> bool:
+        if self.max_concurrency and self.running >= self.max_concurrency:
+            return False
+        return not (
+            self.max_concurrency_per_user
+            and self._running_per_user[api_user_id] >= self.max_concurrency_per_user
+        )
+
+    def _get_tag(self, api_user_id: str) -> float:
+        # Each request of a user is due 1 / weight after the previous one, so
+        # users are served in proportion to their weight
+        weight = float(self.weights.get(api_user_id, 1))
+        tag = max(self._virtual_time, self._last_tags.get(api_user_id, 0.0))
+        tag += 1 / weight
+        self._last_tags[api_user_id] = tag
+        return tag
+
+    def _start(self, api_user_id: str):
+        self.running += 1
+        self._running_per_user[api_user_id] += 1
+        self.stats.admitted += 1
+
+    def _release(self, api_user_id: str):
+        self.running -= 1
+        self._running_per_user[api_user_id] -= 1
+        if not self._running_per_user[api_user_id]:
+            del self._running_per_user[api_user_id]
+        self._dispatch()
+        self._forget_idle_users()
+
+    def _forget_idle_users(self):
+        # A user with nothing queued or running whose tag the virtual time has
+        # caught up with gets the same tag as a new user, so drop it
+        active = set(self._running_per_user)
+        active.update(waiter.api_user_id for waiter in self._queue)
+        for api_user_id, tag in list(self._last_tags.items()):
+            if api_user_id not in active and tag <= self._virtual_time:
+                del self._last_tags[api_user_id]
+
+    def _dispatch(self):
+        while self._queue:
+            waiters = [
+                waiter for waiter in self._queue if self._can_run(waiter.api_user_id)
+            ]
+            if not waiters:
+                return
+            waiter = min(waiters, key=lambda waiter: (waiter.tag, waiter.sequence))
+            self._queue.remove(waiter)
+            self._virtual_time = waiter.tag
+            self._start(waiter.api_user_id)
+            waiter.future.set_result(None)
+
+    async def acquire(self, api_user_id: str) -> AdmissionTicket:
+        ticket = AdmissionTicket(controller=self, api_user_id=api_user_id)
+        if not self.enabled:
+            # Nothing to release, the ticket only carries the wait time
+            ticket.released = True
+            return ticket
+
+        if not self._queue and self._can_run(api_user_id):
+            self._start(api_user_id)
+            return ticket
+
+        if len(self._queue) >= self.max_queue_size:
+            self.stats.rejected += 1
+            logger.warning(
+                f"Rejected invocation of API user {api_user_id}, "
+                f"{len(self._queue)} invocations queued"
+            )
+            ticket.released = True
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many invocations in progress, try again later",
+            )
+
+        waiter = _Waiter(
+            api_user_id=api_user_id,
+            tag=self._get_tag(api_user_id),
+            sequence=next(self._sequence),
+        )
+        self._queue.append(waiter)
+        # Other users' waiters may be blocked on their own limit only
+        self._dispatch()
+        start = time.perf_counter()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if not waiter.future.cancelled():
+                # Admitted at the same time the caller went away
+                self._release(api_user_id)
+            else:
+                self._queue.remove(waiter)
+                self._forget_idle_users()
+            ticket.released = True
+            raise
+
+        ticket.wait_time = time.perf_counter() - start
+        self.stats.queued += 1
+        self.stats.wait_time += ticket.wait_time
+        self.stats.max_wait_time = max(self.stats.max_wait_time, ticket.wait_time)
+        logger.info(
+            f"Admitted invocation of API user {api_user_id} after "
+            f"{ticket.wait_time * 1000:.1f}ms, queue depth {self.queue_depth}, "
+            f"average wait {self.stats.average_wait_time * 1000:.1f}ms"
+        )
+        return ticket
+
+
+admission = AdmissionController(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    max_concurrency_per_user=ADMISSION_MAX_CONCURRENCY_PER_USER,
+    max_queue_size=ADMISSION_MAX_QUEUE_SIZE,
+    weights=ADMISSION_WEIGHTS,
+)
+
+
+async def admit_invocation(
+    api_user=Depends(get_current_api_user),
+) -> AsyncIterator[AdmissionTicket]:
+    """
+    Dependency holding an admission slot for the API user. The slot is released
+    once the response is sent, which for streaming responses is when the stream
+    ends or the client disconnects.
+    """
+    ticket = await admission.acquire(api_user.id)
+    try:
+        yield ticket
+    finally:
+        ticket.release()
@@ -1,15 +1,26 @@
 import logging
+from typing import Optional
 
 import jwt
 from decouple import config
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from app.utils.cache import get_cache
 from app.utils.prisma import prisma
+from prisma.models import ApiUser
 
 logger = logging.getLogger(__name__)
 security = HTTPBearer()
 
+# API users are cached by id once their token is verified, 0 disables the cache
+API_USER_CACHE_TTL = config("API_USER_CACHE_TTL", 60, cast=int)
+api_user_cache = get_cache(
+    "api_user",
+    max_size=config("API_USER_CACHE_SIZE", 10000, cast=int),
+    ttl=API_USER_CACHE_TTL,
+)
+
 
 def handle_exception(e):
     logger.error(e)
@@ -27,14 +38,46 @@ def decode_jwt(token: str):
     return jwt.decode(token, config("JWT_SECRET"), algorithms=["HS256"])
 
 
+async def _get_cached_api_user(api_user_id: str) -> Optional[ApiUser]:
+    if API_USER_CACHE_TTL <= 0:
+        return None
+    try:
+        cached_api_user = await api_user_cache.get(api_user_id)
+    except Exception as e:
+        logger.error(f"Failed to read API user cache: {e}")
+        return None
+    return ApiUser.parse_raw(cached_api_user) if cached_api_user else None
+
+
+async def _set_cached_api_user(api_user: ApiUser):
+    if API_USER_CACHE_TTL <= 0:
+        return
+    try:
+        await api_user_cache.set(api_user.id, api_user.json())
+    except Exception as e:
+        logger.error(f"Failed to write API user cache: {e}")
+
+
+async def invalidate_api_user(api_user_id: str):
+    """Removes the cached API user, call when the user changes"""
+    try:
+        await api_user_cache.delete(api_user_id)
+    except Exception as e:
+        logger.error(f"Failed to invalidate API user cache: {e}")
+
+
 async def get_current_api_user(
     authorization: HTTPAuthorizationCredentials = Security(security),
 ):
-    token = authorization.credentials
-    decoded_token = decode_jwt(token)
-    api_user = await prisma.apiuser.find_unique(
-        where={"id": decoded_token.get("api_user_id")}
-    )
+    # Verified on every request, so an expired or tampered token is never served
+    # from the cache
+    decoded_token = decode_jwt(authorization.credentials)
+    api_user_id = decoded_token.get("api_user_id")
+    api_user = await _get_cached_api_user(api_user_id) if api_user_id else None
+    if api_user:
+        return api_user
+    api_user = await prisma.apiuser.find_unique(where={"id": api_user_id})
     if not api_user:
         raise HTTPException(status_code=401, detail="Invalid token or expired token")
+    await _set_cached_api_user(api_user)
     return api_user
@@ -0,0 +1,80 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = config("REDIS_URL", None)
+
+
+class LocalCache:
+    """Process-local LRU cache of strings with a time to live per entry"""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Optional[float], str]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        if self.max_size <= 0:
+            return
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+
+class RedisCache:
+    """Cache shared by all workers, stored in Redis under a key prefix"""
+
+    def __init__(self, url: str, prefix: str, ttl: Optional[float] = None):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(f"{self.prefix}:{key}")
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        ttl = ttl if ttl is not None else self.ttl
+        px = int(ttl * 1000) if ttl is not None else None
+        await self.client.set(f"{self.prefix}:{key}", value, px=px)
+
+    async def delete(self, key: str):
+        await self.client.delete(f"{self.prefix}:{key}")
+
+
+def get_cache(
+    prefix: str, max_size: int = 1024, ttl: Optional[float] = None
+) -> Union[LocalCache, RedisCache]:
+    """
+    Returns a Redis backed cache when `REDIS_URL` is set, so entries and their
+    invalidation are shared between workers, and a local cache otherwise.
+    """
+    if REDIS_URL:
+        try:
+            return RedisCache(url=REDIS_URL, prefix=prefix, ttl=ttl)
+        except ImportError:
+            logger.warning("REDIS_URL is set but redis is not installed")
+    return LocalCache(max_size=max_size, ttl=ttl)
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional, Set
+
+import aiohttp
+from decouple import config
+
+from app.agents.base import AgentBase
+from app.utils.prisma import prisma
+from app.utils.streaming import CustomAsyncIteratorCallbackHandler
+from app.workflows.base import WorkflowBase
+from app.workflows.loader import load_workflow_config
+from prisma import Json
+from prisma.enums import JobStatus, JobType
+from prisma.models import Job
+
+logger = logging.getLogger(__name__)
+
+# Number of jobs running at the same time per worker
+JOB_WORKERS = config("JOB_WORKERS", 10, cast=int)
+# Seconds a running job is leased to its worker. The worker renews the lease
+# while the job runs, a job whose lease expired is assumed lost and rerun.
+JOB_LEASE_TIMEOUT = config("JOB_LEASE_TIMEOUT", 60, cast=int)
+JOB_WEBHOOK_TIMEOUT = 10
+
+
+def _to_json(output: Any) -> Json:
+    # Agent outputs may hold intermediate steps that are not serializable
+    return Json(json.loads(json.dumps(output, default=str)))
+
+
+async def _run_agent(job: Job) -> Any:
+    agent = await AgentBase(
+        agent_id=job.agentId,
+        session_id=job.input.get("sessionId"),
+        output_schema=job.input.get("outputSchema"),
+        callback=CustomAsyncIteratorCallbackHandler(),
+    ).get_agent()
+    output = await agent.acall(
+        inputs={"input": job.input.get("input")}, tags=[job.agentId]
+    )
+    if job.input.get("outputSchema"):
+        return json.loads(output.get("output"))
+    return output
+
+
+async def _run_workflow(job: Job) -> Any:
+    workflow_data = await load_workflow_config(workflow_id=job.workflowId)
+    workflow = WorkflowBase(
+        workflow=workflow_data,
+        callbacks=[CustomAsyncIteratorCallbackHandler() for _ in workflow_data.steps],
+        session_id=job.input.get("sessionId"),
+        join=job.input.get("join", "concatenate"),
+        run_id=job.input.get("runId"),
+    )
+    return await workflow.arun(job.input.get("input"))
+
+
+async def _send_webhook(job: Job):
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                job.webhookUrl,
+                json={
+                    "id": job.id,
+                    "status": job.status,
+                    "output": job.output,
+                    "error": job.error,
+                },
+                timeout=aiohttp.ClientTimeout(total=JOB_WEBHOOK_TIMEOUT),
+            ) as response:
+                response.raise_for_status()
+    except Exception as e:
+        logger.error(f"Failed to send webhook of job {job.id}: {e}")
+
+
+class JobRunner:
+    """
+    Runs agent and workflow jobs in the background, at most `max_workers` at a
+    time. Jobs are claimed in the database before they run, so a job is never
+    picked up by two workers. A running job holds a lease of `lease_timeout`
+    seconds, renewed through its `updatedAt` while it runs, and jobs whose lease
+    expired are requeued by every worker.
+    """
+
+    def __init__(self, max_workers: int, lease_timeout: int = JOB_LEASE_TIMEOUT):
+        self.max_workers = max_workers
+        self.lease_timeout = lease_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # References to running tasks, the event loop only keeps weak ones
+        self._tasks: Set[asyncio.Task] = set()
+        self._reaper: Optional[asyncio.Task] = None
+
+    def submit(self, job_id: str):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        task = asyncio.ensure_future(self._run(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _claim(self, job_id: str) -> Optional[Job]:
+        claimed = await prisma.job.update_many(
+            where={"id": job_id, "status": JobStatus.PENDING},
+            data={
+                "status": JobStatus.RUNNING,
+                "startedAt": datetime.now(timezone.utc),
+            },
+        )
+        if not claimed:
+            return None
+        return await prisma.job.find_unique(where={"id": job_id})
+
+    async def _renew_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_timeout / 3)
+            try:
+                await prisma.job.update_many(
+                    where={"id": job_id, "status": JobStatus.RUNNING},
+                    data={"updatedAt": datetime.now(timezone.utc)},
+                )
+            except Exception as e:
+                logger.error(f"Failed to renew the lease of job {job_id}: {e}")
+
+    async def _run(self, job_id: str):
+        async with self._semaphore:
+            job = await self._claim(job_id)
+            if job is None:
+                return
+
+            logger.info(f"Running {job.type} job {job.id}")
+            lease = asyncio.ensure_future(self._renew_lease(job.id))
+            try:
+                if job.type == JobType.AGENT:
+                    output = await _run_agent(job)
+                else:
+                    output = await _run_workflow(job)
+                job = await prisma.job.update(
+                    where={"id": job.id},
+                    data={
+                        "status": JobStatus.DONE,
+                        "output": _to_json(output),
+                        "finishedAt": datetime.now(timezone.utc),
+                    },
+                )
+            except Exception as e:
+                logger.error(f"Error running job {job.id}: {e}")
+                job = await prisma.job.update(
+                    where={"id": job.id},
+                    data={
+                        "status": JobStatus.FAILED,
+                        "error": str(e),
+                        "finishedAt": datetime.now(timezone.utc),
+                    },
+                )
+            finally:
+                lease.cancel()
+
+        if job.webhookUrl:
+            await _send_webhook(job)
+
+    async def _requeue_expired(self) -> List[str]:
+        """Requeues the running jobs whose lease expired, e.g. with a crashed worker"""
+        expired = {
+            "status": JobStatus.RUNNING,
+            "updatedAt": {
+                "lt": datetime.now(timezone.utc) - timedelta(seconds=self.lease_timeout)
+            },
+        }
+        jobs = await prisma.job.find_many(where=expired)
+        job_ids = [job.id for job in jobs]
+        if not job_ids:
+            return []
+        requeued = await prisma.job.update_many(
+            where={**expired, "id": {"in": job_ids}},
+            data={"status": JobStatus.PENDING},
+        )
+        if requeued:
+            logger.warning(f"Requeued {requeued} jobs whose lease expired")
+        return job_ids
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(self.lease_timeout)
+            try:
+                # Jobs another worker requeued first are not claimed twice
+                for job_id in await self._requeue_expired():
+                    self.submit(job_id)
+            except Exception as e:
+                logger.error(f"Failed to requeue expired jobs: {e}")
+
+    async def resume(self):
+        """
+        Requeues jobs whose worker went away, submits all pending jobs and
+        starts requeuing expired jobs periodically, call on startup.
+        """
+        await self._requeue_expired()
+        jobs = await prisma.job.find_many(
+            where={"status": JobStatus.PENDING}, order={"createdAt": "asc"}
+        )
+        for job in jobs:
+            self.submit(job.id)
+        if jobs:
+            logger.info(f"Resumed {len(jobs)} pending jobs")
+        if self._reaper is None:
+            self._reaper = asyncio.ensure_future(self._reap())
+
+    def shutdown(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+
+job_runner = JobRunner(max_workers=JOB_WORKERS)
+
+
+async def create_job(
+    api_user_id: str,
+    type: JobType,
+    input: dict,
+    agent_id: Optional[str] = None,
+    workflow_id: Optional[str] = None,
+    webhook_url: Optional[str] = None,
+) -> Job:
+    job = await prisma.job.create(
+        {
+            "type": type,
+            "agentId": agent_id,
+            "workflowId": workflow_id,
+            "input": Json(input),
+            "webhookUrl": webhook_url,
+            "apiUserId": api_user_id,
+        }
+    )
+    job_runner.submit(job.id)
+    return job
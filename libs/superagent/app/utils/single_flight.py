@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Shares one execution between concurrent calls with the same key. The
+    execution runs in its own task, so it is not cancelled when the caller that
+    started it goes away while others are still waiting for it.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key))
+        else:
+            logger.info(f"Joined in-flight invocation for {key[0]}")
+        return await asyncio.shield(task)
+
+
+class StreamBroadcast:
+    """
+    Reads a stream once and replays it to every subscriber. Subscribers that
+    join late first receive the frames sent so far. The source is closed when
+    the last subscriber leaves.
+    """
+
+    def __init__(self, source: AsyncIterable[str]):
+        self.frames: List[str] = []
+        self.finished = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._read(source))
+
+    async def _read(self, source: AsyncIterable[str]):
+        try:
+            async for frame in source:
+                self.frames.append(frame)
+                self._notify()
+        finally:
+            self.finished = True
+            self._notify()
+
+    def _notify(self):
+        # Waiters hold on to the current event, so a fresh one is used for the
+        # next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(self.frames):
+                    yield self.frames[index]
+                    index += 1
+                elif self.finished:
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.task.done():
+                self.task.cancel()
+
+
+class StreamingSingleFlight:
+    """Shares one stream between concurrent streaming calls with the same key"""
+
+    def __init__(self):
+        self._broadcasts: Dict[Hashable, StreamBroadcast] = {}
+
+    def subscribe(
+        self, key: Hashable, source: AsyncIterable[str]
+    ) -> AsyncIterator[str]:
+        """
+        Returns a stream of the in-flight call for `key`, or starts `source` if
+        there is none. `source` should be lazy, it is dropped unread when joining.
+        """
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None:
+            broadcast = StreamBroadcast(source)
+            self._broadcasts[key] = broadcast
+            broadcast.task.add_done_callback(lambda _: self._broadcasts.pop(key))
+        else:
+            logger.info(f"Joined in-flight streaming invocation for {key[0]}")
+        return broadcast.subscribe()
+
+
+single_flight = SingleFlight()
+streaming_single_flight = StreamingSingleFlight()
@@ -1,17 +1,80 @@
 from __future__ import annotations
 
+import ast
 import asyncio
-from typing import Any, AsyncIterator, Dict, List, Literal, Union, cast
+import json
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+from uuid import UUID
 
 from langchain.callbacks.base import AsyncCallbackHandler
 from langchain.schema.messages import BaseMessage
 from langchain.schema.output import LLMResult
 
 
+# Put on the queue when the done event is set, so consumers only ever wait on
+# the queue
+_DONE = object()
+# Put on the queue when a batch of coalesced tokens is due
+_FLUSH = object()
+# Maximum number of characters of a tool output sent to the client
+TOOL_OUTPUT_MAX_LENGTH = 1000
+
+
+class StreamEvent(NamedTuple):
+    """A named SSE event streamed alongside the LLM tokens"""
+
+    event: str
+    data: Dict[str, Any]
+
+
+def format_sse(token_or_event: Union[str, StreamEvent], id: str = None) -> str:
+    """Formats a streamed token or event as an SSE frame"""
+    frame = f"id: {id}\n" if id else ""
+    if isinstance(token_or_event, StreamEvent):
+        return (
+            f"{frame}event: {token_or_event.event}\n"
+            f"data: {json.dumps(token_or_event.data, default=str)}\n\n"
+        )
+    return f"{frame}data: {token_or_event}\n\n"
+
+
+def _parse_tool_input(input_str: str) -> Any:
+    # Langchain passes structured tool inputs as the `str()` of a dict
+    if input_str.startswith("{"):
+        try:
+            return ast.literal_eval(input_str)
+        except Exception:
+            pass
+    return input_str
+
+
+class _DoneEvent(asyncio.Event):
+    """Event that also wakes up the consumer of the token queue when set."""
+
+    def __init__(self, queue: asyncio.Queue) -> None:
+        super().__init__()
+        self._queue = queue
+
+    def set(self) -> None:
+        if not self.is_set():
+            super().set()
+            self._queue.put_nowait(_DONE)
+
+
 class CustomAsyncIteratorCallbackHandler(AsyncCallbackHandler):
     """Callback handler that returns an async iterator."""
 
-    queue: asyncio.Queue[str]
+    queue: asyncio.Queue[Union[str, StreamEvent]]
 
     done: asyncio.Event
 
@@ -21,7 +84,8 @@ class CustomAsyncIteratorCallbackHandler(AsyncCallbackHandler):
 
     def __init__(self) -> None:
         self.queue = asyncio.Queue()
-        self.done = asyncio.Event()
+        self.done = _DoneEvent(self.queue)
+        self.tool_runs: Dict[UUID, Dict[str, Any]] = {}
 
     async def on_chat_model_start(
         self,
@@ -59,30 +123,173 @@ class CustomAsyncIteratorCallbackHandler(AsyncCallbackHandler):
     ) -> None:
         self.done.set()
 
-    async def aiter(self) -> AsyncIterator[str]:
-        while not self.queue.empty() or not self.done.is_set():
-            # Wait for the next token in the queue,
-            # but stop waiting if the done event is set
-            done, other = await asyncio.wait(
-                [
-                    # NOTE: If you add other tasks here, update the code below,
-                    # which assumes each set has exactly one task each
-                    asyncio.ensure_future(self.queue.get()),
-                    asyncio.ensure_future(self.done.wait()),
-                ],
-                return_when=asyncio.FIRST_COMPLETED,
+    async def on_tool_start(
+        self,
+        serialized: Dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        **_kwargs: Any,
+    ) -> None:
+        tool_run = {
+            "function": serialized.get("name"),
+            "args": _parse_tool_input(input_str),
+        }
+        self.tool_runs[run_id] = {**tool_run, "start": time.perf_counter()}
+        self.queue.put_nowait(StreamEvent(event="function_call", data=tool_run))
+
+    def _end_tool_run(self, run_id: UUID, **result: Any) -> None:
+        tool_run = self.tool_runs.pop(run_id, None)
+        if tool_run is None:
+            return
+        start = tool_run.pop("start")
+        self.queue.put_nowait(
+            StreamEvent(
+                event="function_result",
+                data={
+                    **tool_run,
+                    "duration": round(time.perf_counter() - start, 3),
+                    **result,
+                },
             )
+        )
 
-            # Cancel the other task
-            if other:
-                other.pop().cancel()
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **_kwargs: Any) -> None:
+        output = str(output)
+        self._end_tool_run(
+            run_id,
+            output=output[:TOOL_OUTPUT_MAX_LENGTH],
+            truncated=len(output) > TOOL_OUTPUT_MAX_LENGTH,
+        )
 
-            # Extract the value of the first completed task
-            token_or_done = cast(Union[str, Literal[True]], done.pop().result())
+    async def on_tool_error(
+        self,
+        error: Union[Exception, KeyboardInterrupt],
+        *,
+        run_id: UUID,
+        **_kwargs: Any,
+    ) -> None:
+        self._end_tool_run(run_id, error=str(error))
 
-            # If the extracted value is the boolean True, the done event was set
-            if token_or_done is True:
-                break
+    async def aiter(self) -> AsyncIterator[Union[str, StreamEvent]]:
+        while True:
+            token_or_done = await self.queue.get()
+
+            if token_or_done is _DONE:
+                # The done event may have been cleared again by a consecutive
+                # LLM call, in which case we keep streaming its tokens
+                if self.done.is_set():
+                    break
+                continue
 
-            # Otherwise, the extracted value is a token, which we yield
             yield token_or_done
+
+    async def aiter_coalesced(
+        self,
+        flush_interval: Optional[float] = None,
+        flush_bytes: Optional[int] = None,
+    ) -> AsyncIterator[Union[str, StreamEvent]]:
+        """
+        Like `aiter`, but joins consecutive tokens into batches. A batch is
+        flushed `flush_interval` seconds after its first token at the latest, or
+        as soon as it reaches `flush_bytes`. Without an interval a batch holds
+        the tokens already queued and is flushed once the queue is drained.
+        """
+        loop = asyncio.get_event_loop()
+        buffer: List[str] = []
+        buffer_bytes = 0
+        flush_handle = None
+
+        try:
+            while True:
+                if buffer and flush_interval is None and self.queue.empty():
+                    token_or_marker = _FLUSH
+                else:
+                    token_or_marker = await self.queue.get()
+
+                if token_or_marker is _DONE:
+                    if not self.done.is_set():
+                        continue
+                    if buffer:
+                        yield "".join(buffer)
+                    break
+
+                if isinstance(token_or_marker, StreamEvent):
+                    # Events are never batched, send the pending tokens first
+                    if buffer:
+                        if flush_handle is not None:
+                            flush_handle.cancel()
+                            flush_handle = None
+                        yield "".join(buffer)
+                        buffer = []
+                        buffer_bytes = 0
+                    yield token_or_marker
+                    continue
+
+                if token_or_marker is not _FLUSH:
+                    if not buffer and flush_interval is not None:
+                        flush_handle = loop.call_later(
+                            flush_interval, self.queue.put_nowait, _FLUSH
+                        )
+                    buffer.append(token_or_marker)
+                    buffer_bytes += len(token_or_marker.encode())
+                    if flush_bytes is None or buffer_bytes < flush_bytes:
+                        continue
+
+                if buffer:
+                    if flush_handle is not None:
+                        flush_handle.cancel()
+                        flush_handle = None
+                    yield "".join(buffer)
+                    buffer = []
+                    buffer_bytes = 0
+        finally:
+            if flush_handle is not None:
+                flush_handle.cancel()
+
+
+def stream_tokens(
+    callback: CustomAsyncIteratorCallbackHandler,
+    flush_interval_ms: Optional[int] = None,
+    flush_bytes: Optional[int] = None,
+) -> AsyncIterator[Union[str, StreamEvent]]:
+    """Iterates the callback tokens and events, coalesced when flushing is configured"""
+    if not flush_interval_ms and not flush_bytes:
+        return callback.aiter()
+    return callback.aiter_coalesced(
+        flush_interval=flush_interval_ms / 1000 if flush_interval_ms else None,
+        flush_bytes=flush_bytes or None,
+    )
+
+
+async def merge_streams(
+    streams: List[AsyncIterator[Any]],
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Interleaves the items of several streams as they arrive, each paired with
+    the index of its stream.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def read(index: int, stream: AsyncIterator[Any]):
+        try:
+            async for item in stream:
+                queue.put_nowait((index, item))
+        finally:
+            queue.put_nowait((index, _DONE))
+
+    tasks = [
+        asyncio.ensure_future(read(index, stream))
+        for index, stream in enumerate(streams)
+    ]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            index, item = await queue.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            yield index, item
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -6,11 +6,11 @@ from typing import List, Literal, Optional
 import backoff
 from decouple import config
 from langchain.docstore.document import Document
-from langchain.embeddings.openai import OpenAIEmbeddings  # type: ignore
 from pydantic.dataclasses import dataclass
 
 from app.utils.helpers import get_first_non_null
 from app.vectorstores.astra_client import AstraClient, QueryResponse
+from app.vectorstores.embeddings import get_embeddings
 
 logger = logging.getLogger(__name__)
 
@@ -90,10 +90,7 @@ class AstraVectorStore:
             variables["ASTRA_DB_COLLECTION_NAME"],
         )
 
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-ada-002",
-            openai_api_key=os.getenv("OPENAI_API_KEY", ""),
-        )
+        self.embeddings = get_embeddings(openai_api_key=os.getenv("OPENAI_API_KEY", ""))
 
     @backoff.on_exception(backoff.expo, Exception, max_tries=3)
     def _embed_with_retry(self, texts):
@@ -230,17 +227,48 @@ class AstraVectorStore:
 
     def delete(self, datasource_id: str):
         try:
-            pass
+            self.index.delete(filter={"datasource_id": datasource_id})
         except Exception as e:
             logger.error(f"Failed to delete {datasource_id}. Error: {e}")
 
+    def delete_sources(self, datasource_id: str, sources: List[str]):
+        logger.info(f"Deleting vectors of {len(sources)} sources of {datasource_id}")
+        for source in sources:
+            self.index.delete(filter={"datasource_id": datasource_id, "source": source})
+
+    def query_cache(
+        self, vector: List[float], metadata_filter: dict, min_score: float
+    ) -> Optional[dict]:
+        """Returns the metadata of the closest cache entry above `min_score`"""
+        response: QueryResponse = self.index.query(
+            vector,
+            filter={**metadata_filter, "type": "cache"},
+            top_k=1,
+            include_metadata=True,
+        )
+        for match in response.matches:
+            if match.score >= min_score:
+                return {**match.metadata, "score": match.score}
+        return None
+
+    def add_cache_entry(self, vector: List[float], prompt: str, metadata: dict):
+        self.index.upsert(
+            to_upsert=[
+                (
+                    str(uuid.uuid4()),
+                    vector,
+                    {**metadata, "text": prompt, "type": "cache"},
+                )
+            ]
+        )
+
     def clear_cache(self, agent_id: str, datasource_id: Optional[str] = None):
         try:
             filter_dict = {"agentId": agent_id, "type": "cache"}
             if datasource_id:
                 filter_dict["datasource_id"] = datasource_id
 
-            self.index.delete(filter=dict(filter_dict), delete_all=False)
+            self.index.delete(filter=dict(filter_dict))
             logger.info(f"Deleted vectors with agentId `{agent_id}`.")
         except Exception as e:
             logger.error(
@@ -98,6 +98,10 @@ class VectorStoreBase:
     def delete(self, datasource_id: str):
         self.instance.delete(datasource_id)
 
+    def delete_sources(self, datasource_id: str, sources: list[str]):
+        """Deletes the vectors of documents with the given `source` metadata"""
+        self.instance.delete_sources(datasource_id, sources)
+
     # @backoff.on_exception(backoff.expo, Exception, max_tries=3)
     # def _embed_with_retry(self, texts):
     #     return self.instance.embeddings.embed_documents(texts)
@@ -105,5 +109,17 @@ class VectorStoreBase:
     def embed_documents(self, documents: list[Document], batch_size: int = 20):
         self.instance.embed_documents(documents, batch_size)
 
+    @property
+    def supports_cache(self) -> bool:
+        return hasattr(self.instance, "add_cache_entry")
+
+    def query_cache(
+        self, vector: list[float], metadata_filter: dict, min_score: float
+    ) -> dict | None:
+        return self.instance.query_cache(vector, metadata_filter, min_score)
+
+    def add_cache_entry(self, vector: list[float], prompt: str, metadata: dict):
+        self.instance.add_cache_entry(vector, prompt, metadata)
+
     def clear_cache(self, agent_id: str, datasource_id: str | None = None):
         self.instance.clear_cache(agent_id, datasource_id)
@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from decouple import config
+from langchain.embeddings.base import Embeddings
+from langchain.embeddings.openai import OpenAIEmbeddings  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_CACHE_PATH = config("EMBEDDING_CACHE_PATH", ".embedding_cache.sqlite3")
+# 0 disables the cache, an ada-002 embedding takes about 6KB on disk
+EMBEDDING_CACHE_MAX_ENTRIES = config("EMBEDDING_CACHE_MAX_ENTRIES", 100000, cast=int)
+
+
+class EmbeddingCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class EmbeddingCache:
+    """
+    Embeddings stored in SQLite by the hash of the model and text, so a text is
+    embedded once across datasources and re-ingests. The least recently used
+    entries are evicted once the cache holds more than `max_entries`.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.stats = EmbeddingCacheStats()
+        self._connection: Optional[sqlite3.Connection] = None
+        # Documents are embedded in executor threads
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # Lets the workers of the API read while one of them writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, usedAt REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_usedAt_idx "
+                "ON embeddings (usedAt)"
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def get_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\n{text}".encode()).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        vectors = {}
+        with self._lock:
+            # Stays below SQLite's limit of host parameters per statement
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                rows = self.connection.execute(
+                    "SELECT key, vector FROM embeddings "
+                    f"WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, vector in rows:
+                    vectors[key] = array("f", vector).tolist()
+            if vectors:
+                self.connection.executemany(
+                    "UPDATE embeddings SET usedAt = ? WHERE key = ?",
+                    [(time.time(), key) for key in vectors],
+                )
+                self.connection.commit()
+        return vectors
+
+    def set_many(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, usedAt) "
+                "VALUES (?, ?, ?)",
+                [
+                    (key, array("f", vector).tobytes(), now)
+                    for key, vector in vectors.items()
+                ],
+            )
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings "
+                    "ORDER BY usedAt LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self.connection.commit()
+
+
+embedding_cache = EmbeddingCache(
+    path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeds documents through `embedding_cache`, only misses call the model"""
+
+    def __init__(self, embeddings: OpenAIEmbeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not self.cache.enabled or not texts:
+            return self.embeddings.embed_documents(texts)
+
+        keys = [self.cache.get_key(self.embeddings.model, text) for text in texts]
+        try:
+            vectors = self.cache.get_many(keys)
+        except sqlite3.Error as e:
+            logger.error(f"Embedding cache lookup failed: {e}")
+            vectors = {}
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            embedded = dict(
+                zip(
+                    missing.keys(),
+                    self.embeddings.embed_documents(list(missing.values())),
+                )
+            )
+            try:
+                self.cache.set_many(embedded)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to store embeddings in cache: {e}")
+            vectors.update(embedded)
+
+        hits = len(texts) - len(missing)
+        self.cache.stats.hits += hits
+        self.cache.stats.misses += len(missing)
+        logger.info(
+            f"Embedding cache: {hits} hits, {len(missing)} misses, "
+            f"hit rate {self.cache.stats.hit_rate:.1%} since start"
+        )
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+def get_embeddings(openai_api_key: str) -> CachedEmbeddings:
+    return CachedEmbeddings(
+        embeddings=OpenAIEmbeddings(
+            model=EMBEDDING_MODEL, openai_api_key=openai_api_key
+        ),
+        cache=embedding_cache,
+    )
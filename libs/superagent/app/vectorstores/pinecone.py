@@ -6,11 +6,11 @@ import backoff
 import pinecone
 from decouple import config
 from langchain.docstore.document import Document
-from langchain.embeddings.openai import OpenAIEmbeddings  # type: ignore
 from pinecone.core.client.models import QueryResponse
 from pydantic.dataclasses import dataclass
 
 from app.utils.helpers import get_first_non_null
+from app.vectorstores.embeddings import get_embeddings
 
 logger = logging.getLogger(__name__)
 
@@ -79,9 +79,7 @@ class PineconeVectorStore:
         self.index_name = variables["PINECONE_INDEX"]
         logger.info(f"Index name: {self.index_name}")
         self.index = pinecone.Index(self.index_name)
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-ada-002", openai_api_key=config("OPENAI_API_KEY")
-        )  # type: ignore
+        self.embeddings = get_embeddings(openai_api_key=config("OPENAI_API_KEY"))
 
     @backoff.on_exception(backoff.expo, Exception, max_tries=3)
     def _embed_with_retry(self, texts):
@@ -225,6 +223,38 @@ class PineconeVectorStore:
         except Exception as e:
             logger.error(f"Failed to delete {datasource_id}. Error: {e}")
 
+    def delete_sources(self, datasource_id: str, sources: list[str]):
+        logger.info(f"Deleting vectors of {len(sources)} sources of {datasource_id}")
+        self.index.delete(
+            filter={"datasource_id": datasource_id, "source": {"$in": sources}}
+        )
+
+    def query_cache(
+        self, vector: list[float], metadata_filter: dict, min_score: float
+    ) -> dict | None:
+        """Returns the metadata of the closest cache entry above `min_score`"""
+        response: QueryResponse = self.index.query(
+            vector,
+            filter={**metadata_filter, "type": "cache"},
+            top_k=1,
+            include_metadata=True,
+        )
+        for match in response["matches"]:
+            if match["score"] >= min_score:
+                return {**match["metadata"], "score": match["score"]}
+        return None
+
+    def add_cache_entry(self, vector: list[float], prompt: str, metadata: dict):
+        self.index.upsert(
+            vectors=[
+                (
+                    str(uuid.uuid4()),
+                    vector,
+                    {**metadata, "text": prompt, "type": "cache"},
+                )
+            ]
+        )
+
     def clear_cache(self, agent_id: str, datasource_id: str | None = None):
         try:
             filter_dict = {"agentId": agent_id, "type": "cache"}
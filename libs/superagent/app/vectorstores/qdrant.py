@@ -1,15 +1,15 @@
 import logging
+import uuid
 from typing import Literal
 
-import openai
 from decouple import config
 from langchain.docstore.document import Document
-from langchain.embeddings.openai import OpenAIEmbeddings  # type: ignore
 from qdrant_client import QdrantClient, models
 from qdrant_client.http import models as rest
 from qdrant_client.http.models import PointStruct
 
 from app.utils.helpers import get_first_non_null
+from app.vectorstores.embeddings import get_embeddings
 
 logger = logging.getLogger(__name__)
 
@@ -54,9 +54,7 @@ class QdrantVectorStore:
             url=variables["QDRANT_HOST"],
             api_key=variables["QDRANT_API_KEY"],
         )
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-ada-002", openai_api_key=config("OPENAI_API_KEY")
-        )
+        self.embeddings = get_embeddings(openai_api_key=config("OPENAI_API_KEY"))
 
         self.index_name = variables["QDRANT_INDEX"]
         logger.info(f"Initialized Qdrant Client with: {self.index_name}")
@@ -75,17 +73,16 @@ class QdrantVectorStore:
                     ),
                 },
             )
+        embeddings = self.embeddings.embed_documents(
+            [document.page_content for document in documents]
+        )
         points = []
-        i = 0
-        for document in documents:
-            i += 1
-            response = openai.embeddings.create(
-                input=document.page_content, model="text-embedding-ada-002"
-            )
+        for document, embedding in zip(documents, embeddings):
             points.append(
                 PointStruct(
-                    id=i,
-                    vector={"content": response.data[0].embedding},
+                    # Unique across calls, documents are embedded in batches
+                    id=str(uuid.uuid4()),
+                    vector={"content": embedding},
                     payload={"text": document.page_content, **document.metadata},
                 )
             )
@@ -98,10 +95,7 @@ class QdrantVectorStore:
         top_k: int | None,
         _query_type: Literal["document", "all"] = "document",
     ) -> list[str]:
-        response = openai.embeddings.create(
-            input=prompt, model="text-embedding-ada-002"
-        )
-        embeddings = response.data[0].embedding
+        embeddings = self.embeddings.embed_query(prompt)
         search_result = self.client.search(
             collection_name=self.index_name,
             query_vector=("content", embeddings),
@@ -135,3 +129,22 @@ class QdrantVectorStore:
             )
         except Exception as e:
             logger.error(f"Failed to delete {datasource_id}. Error: {e}")
+
+    def delete_sources(self, datasource_id: str, sources: list[str]) -> None:
+        logger.info(f"Deleting vectors of {len(sources)} sources of {datasource_id}")
+        self.client.delete(
+            collection_name=self.index_name,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="datasource_id",
+                            match=models.MatchValue(value=datasource_id),
+                        ),
+                        models.FieldCondition(
+                            key="source", match=models.MatchAny(any=sources)
+                        ),
+                    ],
+                )
+            ),
+        )
@@ -7,9 +7,9 @@ import backoff
 import weaviate
 from decouple import config
 from langchain.docstore.document import Document
-from langchain.embeddings.openai import OpenAIEmbeddings  # type: ignore
 from pydantic.dataclasses import dataclass
 from app.utils.helpers import get_first_non_null
+from app.vectorstores.embeddings import get_embeddings
 
 logger = logging.getLogger(__name__)
 
@@ -84,9 +84,7 @@ class WeaviateVectorStore:
             url=variables["WEAVIATE_URL"],
             auth_client_secret=auth,
         )
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-ada-002", openai_api_key=config("OPENAI_API_KEY")
-        )
+        self.embeddings = get_embeddings(openai_api_key=config("OPENAI_API_KEY"))
 
         self.index_name = variables["WEAVIATE_INDEX"]
         logger.info(f"Initialized Weaviate Client with: {self.index_name}")  # type: ignore
@@ -195,3 +193,30 @@ class WeaviateVectorStore:
             )
         except Exception as e:
             logger.error(f"Failed to delete {datasource_id}. Error: {e}")
+
+    def delete_sources(self, datasource_id: str, sources: List[str]) -> None:
+        logger.info(f"Deleting vectors of {len(sources)} sources of {datasource_id}")
+        self.client.batch.delete_objects(
+            class_name=self.index_name.capitalize(),
+            where={
+                "operator": "And",
+                "operands": [
+                    {
+                        "path": ["datasource_id"],
+                        "operator": "Equal",
+                        "valueText": datasource_id,
+                    },
+                    {
+                        "operator": "Or",
+                        "operands": [
+                            {
+                                "path": ["source"],
+                                "operator": "Equal",
+                                "valueText": source,
+                            }
+                            for source in sources
+                        ],
+                    },
+                ],
+            },
+        )
@@ -1,48 +1,289 @@
 import asyncio
-from typing import Any, List
+import hashlib
+import itertools
+import json
+import logging
+import uuid
+from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple
+
+from decouple import config
 
 from app.agents.base import AgentBase
+from app.agents.cache import get_agent_version, get_version_hash
+from app.utils.cache import get_cache
+from app.utils.prisma import prisma
 from app.utils.streaming import CustomAsyncIteratorCallbackHandler
-from prisma.models import Workflow
+from prisma import Json
+from prisma.enums import WorkflowRunStatus
+from prisma.models import WorkflowStep, WorkflowStepRun
+from prisma.partials import WorkflowConfig
+
+logger = logging.getLogger(__name__)
+
+# Responses of memoized steps by agent version and input
+step_cache = get_cache(
+    "workflow_step",
+    max_size=config("WORKFLOW_STEP_CACHE_SIZE", 1024, cast=int),
+    ttl=config("WORKFLOW_STEP_CACHE_TTL", 86400, cast=int),
+)
 
 
 class WorkflowBase:
     def __init__(
         self,
-        workflow: Workflow,
+        workflow: WorkflowConfig,
         callbacks: List[CustomAsyncIteratorCallbackHandler],
         session_id: str,
         enable_streaming: bool = False,
+        join: Literal["concatenate", "json"] = "concatenate",
+        run_id: Optional[str] = None,
     ):
         self.workflow = workflow
         self.enable_streaming = enable_streaming
         self.session_id = session_id
         self.callbacks = callbacks
+        # How the outputs of steps sharing an order are merged, see `_join`
+        self.join = join
+        # Steps are persisted under the run id as they complete, an existing run
+        # is resumed from its first incomplete step
+        self.resume = run_id is not None
+        self.run_id = run_id or str(uuid.uuid4())
+
+    def _join(self, steps: Sequence[WorkflowStep], responses: List[Dict]) -> str:
+        if self.join == "json":
+            return json.dumps(
+                {
+                    step.agent.name: response.get("output")
+                    for step, response in zip(steps, responses)
+                }
+            )
+        return "\n\n".join(response.get("output") for response in responses)
+
+    async def _map_step(
+        self,
+        step: WorkflowStep,
+        agent: Any,
+        callback: CustomAsyncIteratorCallbackHandler,
+        input: Any,
+    ) -> Dict:
+        """
+        Runs the agent once per element of a JSON list input. Failed elements
+        are reported in `results` and passed on as null, so one bad element does
+        not fail the whole step.
+        """
+        try:
+            elements = json.loads(input)
+        except (TypeError, ValueError):
+            elements = None
+        if isinstance(elements, list):
+            response = await self._map_elements(step, agent, elements)
+        else:
+            response = await agent.acall(inputs={"input": input})
+        # The agent of a map step doesn't stream
+        await self._replay(callback, response.get("output"))
+        return response
+
+    async def _map_elements(
+        self, step: WorkflowStep, agent: Any, elements: List[Any]
+    ) -> Dict:
+        semaphore = asyncio.Semaphore(max(1, step.mapConcurrency))
+
+        async def run_element(index: int, element: Any) -> Dict:
+            async with semaphore:
+                try:
+                    response = await agent.acall(
+                        inputs={
+                            "input": element
+                            if isinstance(element, str)
+                            else json.dumps(element)
+                        },
+                    )
+                    return {
+                        "index": index,
+                        "success": True,
+                        "output": response.get("output"),
+                    }
+                except Exception as e:
+                    logger.error(f"Error in map step {step.id} element {index}: {e}")
+                    return {"index": index, "success": False, "error": str(e)}
+
+        results = await asyncio.gather(
+            *[run_element(index, element) for index, element in enumerate(elements)]
+        )
+        return {
+            "input": elements,
+            "output": json.dumps([result.get("output") for result in results]),
+            "results": results,
+        }
+
+    async def _start_run(self, input: Any) -> Tuple[Any, Dict[str, WorkflowStepRun]]:
+        """Returns the run input and the completed steps of the run by step id"""
+        if not self.resume:
+            await prisma.workflowrun.create(
+                {"id": self.run_id, "workflowId": self.workflow.id, "input": input}
+            )
+            return input, {}
+
+        run = await prisma.workflowrun.find_unique_or_raise(
+            where={"id": self.run_id}, include={"steps": True}
+        )
+        if run.workflowId != self.workflow.id:
+            raise Exception(f"Run {self.run_id} is not a run of this workflow")
+        await prisma.workflowrun.update(
+            where={"id": self.run_id}, data={"status": WorkflowRunStatus.RUNNING}
+        )
+        logger.info(f"Resuming run {self.run_id} after {len(run.steps)} steps")
+        return run.input, {step_run.stepId: step_run for step_run in run.steps}
+
+    async def _build_agent(
+        self, step: WorkflowStep, callback: CustomAsyncIteratorCallbackHandler
+    ) -> Any:
+        # Map steps run their elements concurrently, so their agent neither
+        # shares chat memory between elements nor streams
+        return await AgentBase(
+            agent_id=step.agentId,
+            enable_streaming=not step.mapInput,
+            callback=callback,
+            session_id=self.session_id,
+            enable_memory=not step.mapInput,
+            config=step.agent,
+        ).get_agent()
+
+    async def _get_agent(
+        self,
+        step: WorkflowStep,
+        callback: CustomAsyncIteratorCallbackHandler,
+        step_run: Optional[WorkflowStepRun],
+    ) -> Any:
+        # The agent of a memoized step is only built on a cache miss, see
+        # `_run_step`
+        if step_run is not None or step.memoize:
+            return None
+        return await self._build_agent(step, callback)
+
+    def _get_cache_key(self, step: WorkflowStep, input: Any) -> str:
+        # Versioned by the preloaded config, so a hit needs no agent build
+        return ":".join(
+            [
+                step.agentId,
+                get_version_hash(get_agent_version(step.agent)),
+                "map" if step.mapInput else "",
+                hashlib.sha256(str(input).encode()).hexdigest(),
+            ]
+        )
+
+    async def _get_cached_response(self, cache_key: str) -> Optional[Dict]:
+        try:
+            cached_response = await step_cache.get(cache_key)
+        except Exception as e:
+            logger.error(f"Failed to read workflow step cache: {e}")
+            return None
+        return json.loads(cached_response) if cached_response else None
+
+    async def _set_cached_response(self, cache_key: str, response: Dict):
+        try:
+            await step_cache.set(cache_key, json.dumps(response))
+        except Exception as e:
+            logger.error(f"Failed to write workflow step cache: {e}")
+
+    async def _replay(self, callback: CustomAsyncIteratorCallbackHandler, output: str):
+        """Sends an output that was not streamed by the agent as a single token"""
+        await callback.on_llm_new_token(output)
+        callback.done.set()
+
+    async def _run_step(
+        self,
+        step: WorkflowStep,
+        agent: Any,
+        callback: CustomAsyncIteratorCallbackHandler,
+        input: Any,
+        step_run: Optional[WorkflowStepRun],
+    ) -> Dict:
+        if step_run is not None:
+            # Completed by an earlier attempt of the run, replay its output
+            await self._replay(callback, step_run.output)
+            return step_run.response
+
+        cache_key = self._get_cache_key(step, input) if step.memoize else None
+        response = await self._get_cached_response(cache_key) if cache_key else None
+        if response is not None:
+            logger.info(f"Reused memoized output of step {step.id}")
+            await self._replay(callback, response.get("output"))
+        else:
+            if agent is None:
+                agent = await self._build_agent(step, callback)
+            if step.mapInput:
+                response = await self._map_step(step, agent, callback, input)
+            else:
+                response = await agent.acall(inputs={"input": input})
+            # Agent responses may hold intermediate steps that are not
+            # serializable
+            response = json.loads(json.dumps(response, default=str))
+            if cache_key:
+                await self._set_cached_response(cache_key, response)
+
+        await prisma.workflowsteprun.create(
+            {
+                "runId": self.run_id,
+                "stepId": step.id,
+                "input": str(input),
+                "output": response.get("output"),
+                "response": Json(response),
+            }
+        )
+        return response
 
     async def arun(self, input: Any):
         self.workflow.steps.sort(key=lambda x: x.order)
-        previous_output = input
+        previous_output, step_runs = await self._start_run(input)
         steps_output = {}
-        stepIndex = 0
-
-        for step in self.workflow.steps:
-            agent = await AgentBase(
-                agent_id=step.agentId,
-                enable_streaming=True,
-                callback=self.callbacks[stepIndex],
-                session_id=self.session_id,
-            ).get_agent()
-
-            task = asyncio.ensure_future(
-                agent.acall(
-                    inputs={"input": previous_output},
-                )
+
+        try:
+            # Build every step's agent up front, so each step starts as soon as
+            # the previous one is done instead of waiting for its own agent build
+            agents = await asyncio.gather(
+                *[
+                    self._get_agent(step, callback, step_runs.get(step.id))
+                    for step, callback in zip(self.workflow.steps, self.callbacks)
+                ]
             )
 
-            await task
-            agent_response = task.result()
-            previous_output = agent_response.get("output")
-            steps_output[step.order] = agent_response
+            # Steps sharing an order run concurrently on the same input, and
+            # their joined outputs are the input of the next order
+            for order, level in itertools.groupby(
+                zip(self.workflow.steps, agents, self.callbacks),
+                key=lambda x: x[0].order,
+            ):
+                steps, level_agents, level_callbacks = zip(*level)
+                responses = await asyncio.gather(
+                    *[
+                        self._run_step(
+                            step,
+                            agent,
+                            callback,
+                            previous_output,
+                            step_runs.get(step.id),
+                        )
+                        for step, agent, callback in zip(
+                            steps, level_agents, level_callbacks
+                        )
+                    ]
+                )
+
+                if len(responses) == 1:
+                    previous_output = responses[0].get("output")
+                    steps_output[order] = responses[0]
+                else:
+                    previous_output = self._join(steps, responses)
+                    steps_output[order] = responses
+        except (Exception, asyncio.CancelledError):
+            await prisma.workflowrun.update(
+                where={"id": self.run_id}, data={"status": WorkflowRunStatus.FAILED}
+            )
+            raise
 
-            stepIndex += 1
-        return {"steps": steps_output, "output": previous_output}
+        await prisma.workflowrun.update(
+            where={"id": self.run_id},
+            data={"status": WorkflowRunStatus.DONE, "output": previous_output},
+        )
+        return {"runId": self.run_id, "steps": steps_output, "output": previous_output}
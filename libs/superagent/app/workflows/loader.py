@@ -0,0 +1,18 @@
+from app.agents.loader import AGENT_CONFIG_INCLUDE
+from prisma.partials import WorkflowConfig
+
+# Steps sorted by order with the full agent config of every step, so the step
+# agents are built without loading their configs one by one
+WORKFLOW_CONFIG_INCLUDE = {
+    "steps": {
+        "include": {"agent": {"include": AGENT_CONFIG_INCLUDE}},
+        "order_by": {"order": "asc"},
+    },
+}
+
+
+async def load_workflow_config(workflow_id: str) -> WorkflowConfig:
+    return await WorkflowConfig.prisma().find_unique_or_raise(
+        where={"id": workflow_id},
+        include=WORKFLOW_CONFIG_INCLUDE,
+    )
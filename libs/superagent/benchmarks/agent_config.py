@@ -0,0 +1,72 @@
+"""
+Compares the size of the agent config loaded on every invoke before and after
+the projection-aware loader.
+
+Usage:
+    poetry run python -m benchmarks.agent_config <agent_id> [iterations]
+
+Reports the size of the rows returned by Postgres (as serialized by Prisma),
+the Python heap allocated per load and the resident set size of the process.
+"""
+import asyncio
+import resource
+import sys
+import time
+import tracemalloc
+
+from app.agents.loader import load_agent_config
+from app.utils.prisma import prisma
+
+
+async def load_full_agent_config(agent_id: str):
+    # The include tree used by `AgentBase.get_agent` before the config loader
+    return await prisma.agent.find_unique_or_raise(
+        where={"id": agent_id},
+        include={
+            "llms": {"include": {"llm": True}},
+            "datasources": {"include": {"datasource": {"include": {"vectorDb": True}}}},
+            "tools": {"include": {"tool": True}},
+        },
+    )
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize() / 1024 / 1024
+
+
+async def measure(name: str, loader, agent_id: str, iterations: int):
+    payload_bytes = len((await loader(agent_id)).json().encode())
+    rss_before = rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await loader(agent_id)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<10} payload: {payload_bytes / 1024:10.1f} KiB  "
+        f"peak heap: {peak / 1024:10.1f} KiB  "
+        f"rss delta: {rss_mb() - rss_before:8.1f} MiB  "
+        f"latency: {elapsed / iterations * 1000:8.2f} ms"
+    )
+
+
+async def main(agent_id: str, iterations: int):
+    await prisma.connect()
+    try:
+        await measure("before", load_full_agent_config, agent_id, iterations)
+        await measure("after", load_agent_config, agent_id, iterations)
+    finally:
+        await prisma.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            agent_id=sys.argv[1],
+            iterations=int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+        )
+    )
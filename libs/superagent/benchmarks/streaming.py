@@ -0,0 +1,92 @@
+"""
+Micro-benchmark for `CustomAsyncIteratorCallbackHandler.aiter`.
+
+Usage:
+    poetry run python -m benchmarks.streaming [tokens_per_stream]
+
+Runs 1, 100 and 1000 concurrent streams through the current handler and the
+previous implementation (two futures per token) and reports tokens/sec and the
+CPU time spent by the event loop.
+"""
+import asyncio
+import sys
+import time
+from typing import AsyncIterator, Literal, Union, cast
+
+from langchain.schema.messages import AIMessage
+from langchain.schema.output import ChatGeneration, LLMResult
+
+from app.utils.streaming import CustomAsyncIteratorCallbackHandler
+
+CONCURRENCY_LEVELS = [1, 100, 1000]
+FINAL_RESPONSE = LLMResult(
+    generations=[[ChatGeneration(message=AIMessage(content="done"))]]
+)
+
+
+class LegacyCallbackHandler(CustomAsyncIteratorCallbackHandler):
+    """The handler as it was before the sentinel based queue"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.done = asyncio.Event()
+
+    async def aiter(self) -> AsyncIterator[str]:
+        while not self.queue.empty() or not self.done.is_set():
+            done, other = await asyncio.wait(
+                [
+                    asyncio.ensure_future(self.queue.get()),
+                    asyncio.ensure_future(self.done.wait()),
+                ],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if other:
+                other.pop().cancel()
+            token_or_done = cast(Union[str, Literal[True]], done.pop().result())
+            if token_or_done is True:
+                break
+            yield token_or_done
+
+
+async def produce(callback: CustomAsyncIteratorCallbackHandler, tokens: int):
+    for _ in range(tokens):
+        await callback.on_llm_new_token("token")
+        # Yield to the loop like a network bound LLM client would
+        await asyncio.sleep(0)
+    await callback.on_llm_end(FINAL_RESPONSE)
+
+
+async def consume(callback: CustomAsyncIteratorCallbackHandler) -> int:
+    received = 0
+    async for _ in callback.aiter():
+        received += 1
+    return received
+
+
+async def run(handler_class, streams: int, tokens: int):
+    callbacks = [handler_class() for _ in range(streams)]
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    results = await asyncio.gather(
+        *[consume(callback) for callback in callbacks],
+        *[produce(callback, tokens) for callback in callbacks],
+    )
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    received = sum(results[:streams])
+    return received / wall, cpu
+
+
+def main(tokens: int):
+    print(f"{'handler':<8} {'streams':>8} {'tokens/sec':>14} {'loop cpu (s)':>14}")
+    for streams in CONCURRENCY_LEVELS:
+        for name, handler_class in [
+            ("legacy", LegacyCallbackHandler),
+            ("current", CustomAsyncIteratorCallbackHandler),
+        ]:
+            tokens_per_second, cpu = asyncio.run(run(handler_class, streams, tokens))
+            print(f"{name:<8} {streams:>8} {tokens_per_second:>14.0f} {cpu:>14.3f}")
+
+
+if __name__ == "__main__":
+    main(tokens=int(sys.argv[1]) if len(sys.argv) > 1 else 200)
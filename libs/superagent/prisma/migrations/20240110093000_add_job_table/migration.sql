@@ -0,0 +1,31 @@
+-- CreateEnum
+CREATE TYPE "JobType" AS ENUM ('AGENT', 'WORKFLOW');
+
+-- CreateEnum
+CREATE TYPE "JobStatus" AS ENUM ('PENDING', 'RUNNING', 'DONE', 'FAILED');
+
+-- CreateTable
+CREATE TABLE "Job" (
+    "id" TEXT NOT NULL,
+    "type" "JobType" NOT NULL,
+    "status" "JobStatus" NOT NULL DEFAULT 'PENDING',
+    "agentId" TEXT,
+    "workflowId" TEXT,
+    "input" JSONB NOT NULL,
+    "output" JSONB,
+    "error" TEXT,
+    "webhookUrl" TEXT,
+    "startedAt" TIMESTAMP(3),
+    "finishedAt" TIMESTAMP(3),
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+    "apiUserId" TEXT NOT NULL,
+
+    CONSTRAINT "Job_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX "Job_status_idx" ON "Job"("status");
+
+-- AddForeignKey
+ALTER TABLE "Job" ADD CONSTRAINT "Job_apiUserId_fkey" FOREIGN KEY ("apiUserId") REFERENCES "ApiUser"("id") ON DELETE RESTRICT ON UPDATE CASCADE;
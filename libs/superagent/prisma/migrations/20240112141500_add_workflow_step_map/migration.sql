@@ -0,0 +1,3 @@
+-- AlterTable
+ALTER TABLE "WorkflowStep" ADD COLUMN     "mapConcurrency" INTEGER NOT NULL DEFAULT 5,
+ADD COLUMN     "mapInput" BOOLEAN NOT NULL DEFAULT false;
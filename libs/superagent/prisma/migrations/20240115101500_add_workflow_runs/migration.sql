@@ -0,0 +1,41 @@
+-- CreateEnum
+CREATE TYPE "WorkflowRunStatus" AS ENUM ('RUNNING', 'DONE', 'FAILED');
+
+-- CreateTable
+CREATE TABLE "WorkflowRun" (
+    "id" TEXT NOT NULL,
+    "status" "WorkflowRunStatus" NOT NULL DEFAULT 'RUNNING',
+    "input" TEXT NOT NULL,
+    "output" TEXT,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+    "workflowId" TEXT NOT NULL,
+
+    CONSTRAINT "WorkflowRun_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateTable
+CREATE TABLE "WorkflowStepRun" (
+    "id" TEXT NOT NULL,
+    "input" TEXT NOT NULL,
+    "output" TEXT,
+    "response" JSONB NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+    "runId" TEXT NOT NULL,
+    "stepId" TEXT NOT NULL,
+
+    CONSTRAINT "WorkflowStepRun_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX "WorkflowStepRun_runId_stepId_key" ON "WorkflowStepRun"("runId", "stepId");
+
+-- AddForeignKey
+ALTER TABLE "WorkflowRun" ADD CONSTRAINT "WorkflowRun_workflowId_fkey" FOREIGN KEY ("workflowId") REFERENCES "Workflow"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "WorkflowStepRun" ADD CONSTRAINT "WorkflowStepRun_runId_fkey" FOREIGN KEY ("runId") REFERENCES "WorkflowRun"("id") ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- AddForeignKey
+ALTER TABLE "WorkflowStepRun" ADD CONSTRAINT "WorkflowStepRun_stepId_fkey" FOREIGN KEY ("stepId") REFERENCES "WorkflowStep"("id") ON DELETE CASCADE ON UPDATE CASCADE;
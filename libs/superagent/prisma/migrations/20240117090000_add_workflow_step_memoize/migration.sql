@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "WorkflowStep" ADD COLUMN     "memoize" BOOLEAN NOT NULL DEFAULT false;
@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "Datasource" ADD COLUMN     "syncState" JSONB;
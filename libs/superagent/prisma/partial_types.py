@@ -0,0 +1,37 @@
+from prisma.models import Agent, AgentDatasource, Datasource, Workflow, WorkflowStep
+
+# Datasource without the `content` column, which can hold entire uploaded files
+Datasource.create_partial(
+    "DatasourceConfig",
+    include=[
+        "id",
+        "name",
+        "description",
+        "url",
+        "type",
+        "metadata",
+        "updatedAt",
+        "vectorDbId",
+        "vectorDb",
+    ],
+)
+
+AgentDatasource.create_partial(
+    "AgentDatasourceConfig",
+    relations={"datasource": "DatasourceConfig"},
+)
+
+Agent.create_partial(
+    "AgentConfig",
+    relations={"datasources": "AgentDatasourceConfig"},
+)
+
+WorkflowStep.create_partial(
+    "WorkflowStepConfig",
+    relations={"agent": "AgentConfig"},
+)
+
+Workflow.create_partial(
+    "WorkflowConfig",
+    relations={"steps": "WorkflowStepConfig"},
+)
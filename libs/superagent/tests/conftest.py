@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from typing import Dict, Optional
+
+import pytest
+from aiohttp import web
+
+
+class Site:
+    """
+    Serves `pages` by path from a thread of its own, so it answers both crawls
+    in the test's event loop and crawls run by `crawl` in another thread
+    """
+
+    def __init__(self):
+        self.pages: Dict[str, dict] = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Seconds each response takes
+        self.delay = 0.0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._runner: Optional[web.AppRunner] = None
+        self.port = 0
+
+    def add_page(
+        self,
+        path: str,
+        body: str = "",
+        status: int = 200,
+        content_type: str = "text/html",
+        etag: Optional[str] = None,
+    ):
+        self.pages[path] = {
+            "body": body,
+            "status": status,
+            "content_type": content_type,
+            "etag": etag,
+        }
+
+    def url(self, path: str = "/") -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests.append(request.path_qs)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            page = self.pages.get(request.path)
+            if page is None:
+                return web.Response(status=404)
+            headers = {"ETag": page["etag"]} if page["etag"] else {}
+            if page["etag"] and request.headers.get("If-None-Match") == page["etag"]:
+                return web.Response(status=304, headers=headers)
+            return web.Response(
+                status=page["status"],
+                body=page["body"].encode(),
+                content_type=page["content_type"],
+                headers=headers,
+            )
+        finally:
+            self.in_flight -= 1
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_route("GET", "/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+@pytest.fixture
+def site():
+    site = Site()
+    site.start()
+    yield site
+    site.stop()
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.admission import AdmissionController
+
+
+def get_controller(**kwargs) -> AdmissionController:
+    options = {
+        "max_concurrency": 1,
+        "max_concurrency_per_user": 0,
+        "max_queue_size": 10,
+        "weights": {},
+    }
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+async def acquire_in_order(controller, api_user_ids, admitted):
+    async def acquire(api_user_id):
+        ticket = await controller.acquire(api_user_id)
+        admitted.append(api_user_id)
+        # Lets the next waiter in
+        ticket.release()
+
+    tasks = []
+    for api_user_id in api_user_ids:
+        tasks.append(asyncio.create_task(acquire(api_user_id)))
+        # Queues the waiters in the given order
+        await asyncio.sleep(0)
+    return tasks
+
+
+async def release_all(controller, ticket, tasks):
+    ticket.release()
+    await asyncio.gather(*tasks)
+    assert controller.running == 0
+
+
+def test_disabled_admits_everything():
+    async def run():
+        controller = get_controller(max_concurrency=0)
+        tickets = [await controller.acquire("a") for _ in range(3)]
+        assert controller.running == 0
+        for ticket in tickets:
+            ticket.release()
+        assert controller.running == 0
+
+    asyncio.run(run())
+
+
+def test_fair_queuing_interleaves_users():
+    async def run():
+        controller = get_controller()
+        ticket = await controller.acquire("busy")
+        admitted = []
+        tasks = await acquire_in_order(
+            controller, ["busy", "busy", "busy", "other", "other"], admitted
+        )
+        assert controller.queue_depth == 5
+
+        await release_all(controller, ticket, tasks)
+        assert admitted == ["busy", "other", "busy", "other", "busy"]
+        assert controller.queue_depth == 0
+
+    asyncio.run(run())
+
+
+def test_weights_share_slots():
+    async def run():
+        controller = get_controller(weights={"heavy": 2})
+        ticket = await controller.acquire("light")
+        admitted = []
+        tasks = await acquire_in_order(
+            controller, ["light", "light", "heavy", "heavy", "heavy", "heavy"], admitted
+        )
+
+        await release_all(controller, ticket, tasks)
+        assert admitted == ["heavy", "light", "heavy", "heavy", "light", "heavy"]
+
+    asyncio.run(run())
+
+
+def test_per_user_limit_admits_other_users():
+    async def run():
+        controller = get_controller(max_concurrency=2, max_concurrency_per_user=1)
+        ticket = await controller.acquire("a")
+        admitted = []
+        tasks = await acquire_in_order(controller, ["a", "b"], admitted)
+        await asyncio.sleep(0)
+        # "b" skips the waiter of "a", which is blocked on its own limit
+        assert admitted == ["b"]
+        assert controller.queue_depth == 1
+
+        await release_all(controller, ticket, tasks)
+        assert admitted == ["b", "a"]
+
+    asyncio.run(run())
+
+
+def test_full_queue_rejects():
+    async def run():
+        controller = get_controller(max_queue_size=1)
+        ticket = await controller.acquire("a")
+        tasks = await acquire_in_order(controller, ["a"], [])
+        with pytest.raises(HTTPException) as e:
+            await controller.acquire("b")
+        assert e.value.status_code == 429
+        assert controller.stats.rejected == 1
+
+        await release_all(controller, ticket, tasks)
+
+    asyncio.run(run())
+
+
+def test_release_is_idempotent():
+    async def run():
+        controller = get_controller(max_concurrency=2)
+        ticket = await controller.acquire("a")
+        ticket.release()
+        ticket.release()
+        assert controller.running == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def run():
+        controller = get_controller()
+        ticket = await controller.acquire("a")
+        tasks = await acquire_in_order(controller, ["b"], [])
+        tasks[0].cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tasks[0]
+        assert controller.queue_depth == 0
+
+        ticket.release()
+        assert controller.running == 0
+
+    asyncio.run(run())
+
+
+def test_idle_users_are_forgotten():
+    async def run():
+        controller = get_controller()
+        ticket = await controller.acquire("a")
+        tasks = await acquire_in_order(controller, ["b", "c"], [])
+        assert set(controller._last_tags) == {"b", "c"}
+
+        await release_all(controller, ticket, tasks)
+        assert controller._last_tags == {}
+
+    asyncio.run(run())
@@ -0,0 +1,193 @@
+import asyncio
+
+import pytest
+
+from app.datasource.crawler import Crawler, crawl, extract_html, normalize_url
+
+
+def get_crawler(**kwargs) -> Crawler:
+    return Crawler(host_delay=kwargs.pop("host_delay", 0), **kwargs)
+
+
+def crawl_pages(crawler, urls, **kwargs):
+    async def run():
+        return [page async for page in crawler.crawl(urls, **kwargs)]
+
+    return asyncio.run(run())
+
+
+def links(*paths: str) -> str:
+    return "".join(f'<a href="{path}">{path}</a>' for path in paths)
+
+
+@pytest.mark.parametrize(
+    "url, normalized",
+    [
+        ("HTTP://Example.COM", "http://example.com/"),
+        ("https://example.com:443/a", "https://example.com/a"),
+        ("http://example.com:8080/a", "http://example.com:8080/a"),
+        ("http://example.com/a#section", "http://example.com/a"),
+        ("http://example.com/a?b=2&a=1", "http://example.com/a?a=1&b=2"),
+        (" http://example.com/a/ ", "http://example.com/a/"),
+    ],
+)
+def test_normalize_url(url, normalized):
+    assert normalize_url(url) == normalized
+
+
+def test_normalize_url_rejects_invalid_port():
+    with pytest.raises(ValueError):
+        normalize_url("http://example.com:abc/")
+
+
+def test_extract_html():
+    body = (
+        "<html><head><title> Title </title><style>p {}</style></head>"
+        "<body><p>Text</p><script>code()</script>"
+        '<a href="/a">A</a><a href="http://[bad">Bad</a></body></html>'
+    )
+
+    text, title, page_links = extract_html(body.encode(), "http://example.com/")
+
+    assert "Text" in text
+    assert "code()" not in text and "p {}" not in text
+    assert title == "Title"
+    assert page_links == ["http://example.com/a"]
+
+
+def test_extract_xhtml_with_encoding_declaration():
+    body = (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Café</title>'
+        "</head><body><p>Crème brûlée</p></body></html>"
+    )
+
+    text, title, _ = extract_html(body.encode(), "http://example.com/")
+
+    assert title == "Café"
+    assert "Crème brûlée" in text
+
+
+def test_crawl_follows_links_under_base_url(site):
+    site.add_page("/docs/", "Index" + links("/docs/a", "/docs/b#top", "/blog/"))
+    site.add_page("/docs/a", "A" + links("/docs/c"))
+    site.add_page("/docs/b", "B")
+    site.add_page("/docs/c", "C")
+    site.add_page("/blog/", "Blog")
+
+    pages = crawl_pages(
+        get_crawler(), [site.url("/docs/")], max_depth=1, base_url=site.url("/docs/")
+    )
+
+    assert {page.url for page in pages} == {
+        site.url("/docs/"),
+        site.url("/docs/a"),
+        site.url("/docs/b"),
+    }
+
+
+def test_crawl_fetches_a_page_once(site):
+    site.add_page("/", links("/a?x=1&y=2", "/a?y=2&x=1", "/a?x=1&y=2#top", "/"))
+    site.add_page("/a", "A")
+
+    pages = crawl_pages(get_crawler(), [site.url()], max_depth=1)
+
+    assert len(pages) == 2
+    assert sorted(site.requests) == ["/", "/a?x=1&y=2"]
+
+
+def test_crawl_skips_duplicate_content(site):
+    site.add_page("/", links("/a", "/b"))
+    site.add_page("/a", "Same")
+    site.add_page("/b", "Same")
+    crawler = get_crawler()
+
+    pages = crawl_pages(crawler, [site.url()], max_depth=1)
+
+    assert len(pages) == 2
+    assert crawler.stats.duplicates == 1
+
+
+def test_crawl_skips_invalid_links(site):
+    site.add_page("/", links("http://[bad", "http://127.0.0.1:abc/", "/a"))
+    site.add_page("/a", "A")
+
+    pages = crawl_pages(get_crawler(), [site.url()], max_depth=1)
+
+    assert {page.url for page in pages} == {site.url(), site.url("/a")}
+
+
+def test_crawl_stops_at_max_pages(site):
+    site.add_page("/", links(*[f"/{i}" for i in range(10)]))
+    for i in range(10):
+        site.add_page(f"/{i}", str(i))
+    crawler = get_crawler(max_pages=4)
+
+    pages = crawl_pages(crawler, [site.url()], max_depth=1)
+
+    assert len(pages) == 4
+    assert crawler.truncated
+
+
+def test_crawl_stops_at_max_crawl_time(site):
+    site.add_page("/", "Slow")
+    site.delay = 1
+    crawler = get_crawler(max_crawl_time=0.1)
+
+    assert crawl_pages(crawler, [site.url()]) == []
+    assert crawler.truncated
+
+
+def test_crawl_skips_large_and_binary_pages(site):
+    site.add_page("/", links("/large", "/image", "/text"))
+    site.add_page("/large", "x" * 2000)
+    site.add_page("/image", "png", content_type="image/png")
+    site.add_page("/text", "Plain text", content_type="text/plain")
+    crawler = get_crawler(max_page_size=1000)
+
+    pages = crawl_pages(crawler, [site.url()], max_depth=1)
+
+    assert {page.url: page.text for page in pages if page.url != site.url()} == {
+        site.url("/text"): "Plain text"
+    }
+    assert crawler.stats.skipped == 2
+
+
+def test_crawl_limits_requests_per_host(site):
+    site.add_page("/", links(*[f"/{i}" for i in range(8)]))
+    for i in range(8):
+        site.add_page(f"/{i}", str(i))
+    site.delay = 0.05
+
+    crawl_pages(get_crawler(max_concurrency_per_host=2), [site.url()], max_depth=1)
+
+    assert site.max_in_flight == 2
+
+
+def test_crawl_keeps_known_pages(site):
+    site.add_page("/unchanged", "Unchanged", etag='"1"')
+    site.add_page("/unavailable", "Unavailable", status=503)
+    known_pages = {
+        site.url(path): {"etag": '"1"', "hash": path, "links": []}
+        for path in ("/unchanged", "/unavailable", "/removed")
+    }
+    crawler = get_crawler()
+
+    pages = crawl_pages(crawler, list(known_pages), known_pages=known_pages)
+
+    # Only a 404 or 410 means a page is gone, a 503 keeps it until the next crawl
+    assert {page.url for page in pages} == {
+        site.url("/unchanged"),
+        site.url("/unavailable"),
+    }
+    assert all(page.not_modified for page in pages)
+    assert crawler.stats.failed == 1
+
+
+def test_crawl_in_thread(site):
+    site.add_page("/", "Root" + links("/a"))
+    site.add_page("/a", "A")
+
+    pages = list(crawl([site.url()], crawler=get_crawler(), max_depth=1))
+
+    assert {page.url for page in pages} == {site.url(), site.url("/a")}
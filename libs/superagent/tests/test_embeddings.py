@@ -0,0 +1,67 @@
+import pytest
+
+from app.vectorstores.embeddings import CachedEmbeddings, EmbeddingCache
+
+
+class FakeEmbeddings:
+    model = "fake"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return [0.0, 0.0]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), max_entries=3)
+
+
+def test_cache_miss_then_hit(cache):
+    embeddings = FakeEmbeddings()
+    cached = CachedEmbeddings(embeddings=embeddings, cache=cache)
+
+    assert cached.embed_documents(["a", "bb"]) == [[1.0, 0.5], [2.0, 0.5]]
+    assert cached.embed_documents(["bb", "ccc"]) == [[2.0, 0.5], [3.0, 0.5]]
+
+    assert embeddings.embedded == ["a", "bb", "ccc"]
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 3
+    assert cache.stats.hit_rate == 0.25
+
+
+def test_cache_key_depends_on_model(cache):
+    assert cache.get_key("a", "text") != cache.get_key("b", "text")
+    assert cache.get_key("a", "text") == cache.get_key("a", "text")
+
+
+def test_cache_evicts_least_recently_used(cache, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("app.vectorstores.embeddings.time.time", lambda: now[0])
+    for key in ["a", "b", "c"]:
+        now[0] += 1
+        cache.set_many({key: [1.0]})
+    now[0] += 1
+    # "a" is now used more recently than "b"
+    assert cache.get_many(["a"]) == {"a": [1.0]}
+
+    now[0] += 1
+    cache.set_many({"d": [2.0]})
+
+    assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
+
+
+def test_disabled_cache_embeds_everything(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), max_entries=0)
+    embeddings = FakeEmbeddings()
+    cached = CachedEmbeddings(embeddings=embeddings, cache=cache)
+
+    cached.embed_documents(["a"])
+    cached.embed_documents(["a"])
+
+    assert embeddings.embedded == ["a", "a"]
@@ -0,0 +1,79 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from langchain.docstore.document import Document
+
+from app.datasource import executor
+from app.datasource.executor import iter_chunk_batches
+
+
+class FakeDataLoader:
+    """Loads `chunks` documents, counting the ones handed to the producer"""
+
+    chunks = 20
+    loaded = 0
+
+    def __init__(self, datasource):
+        self.datasource = datasource
+
+    def iter_chunks(self):
+        for index in range(self.chunks):
+            FakeDataLoader.loaded += 1
+            yield Document(page_content=str(index))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # Threads stand in for the ingestion processes
+    pool = ThreadPoolExecutor(max_workers=1)
+    manager = SimpleNamespace(Queue=queue.Queue, Event=threading.Event)
+    monkeypatch.setattr(executor, "get_ingestion_executor", lambda: pool)
+    monkeypatch.setattr(executor, "_get_manager", lambda: manager)
+    monkeypatch.setattr(executor, "DataLoader", FakeDataLoader)
+    monkeypatch.setattr(executor, "INGESTION_BATCH_SIZE", 1)
+    monkeypatch.setattr(executor, "INGESTION_QUEUE_SIZE", 2)
+    monkeypatch.setattr(FakeDataLoader, "loaded", 0)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+@pytest.mark.usefixtures("pool")
+def test_chunk_batches_are_all_yielded():
+    async def run():
+        return [batch async for batch in iter_chunk_batches(SimpleNamespace())]
+
+    batches = asyncio.run(run())
+
+    assert [batch[0].page_content for batch in batches] == [
+        str(index) for index in range(20)
+    ]
+
+
+@pytest.mark.usefixtures("pool")
+def test_producer_waits_for_slow_consumer():
+    async def run():
+        batches = iter_chunk_batches(SimpleNamespace())
+        await batches.__anext__()
+        await asyncio.sleep(0.2)
+        # The queue is full, one batch is read and one waits to be queued
+        assert FakeDataLoader.loaded <= 4
+        await batches.aclose()
+
+    asyncio.run(run())
+
+
+def test_producer_stops_when_consumer_goes_away(pool):
+    async def run():
+        batches = iter_chunk_batches(SimpleNamespace())
+        await batches.__anext__()
+        await batches.aclose()
+
+    asyncio.run(run())
+    # The producer left its task in the pool
+    pool.submit(lambda: None).result(timeout=3)
+
+    assert FakeDataLoader.loaded < FakeDataLoader.chunks
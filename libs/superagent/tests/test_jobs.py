@@ -0,0 +1,138 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import jobs
+from app.utils.jobs import JobRunner
+from prisma.enums import JobStatus, JobType
+
+
+def matches(job, where) -> bool:
+    for field, condition in where.items():
+        value = getattr(job, field)
+        if isinstance(condition, dict):
+            if "lt" in condition and not value < condition["lt"]:
+                return False
+            if "in" in condition and value not in condition["in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeJobs:
+    """The `prisma.job` queries of `JobRunner`, on jobs held in memory"""
+
+    def __init__(self):
+        self.jobs = {}
+
+    def add(self, job_id, status=JobStatus.PENDING, updated_ago=0.0):
+        self.jobs[job_id] = SimpleNamespace(
+            id=job_id,
+            type=JobType.AGENT,
+            status=status,
+            webhookUrl=None,
+            createdAt=datetime.now(timezone.utc),
+            updatedAt=datetime.now(timezone.utc) - timedelta(seconds=updated_ago),
+        )
+
+    def _update(self, job, data):
+        for field, value in data.items():
+            setattr(job, field, value)
+        if "updatedAt" not in data:
+            job.updatedAt = datetime.now(timezone.utc)
+
+    async def update_many(self, where, data):
+        updated = [job for job in self.jobs.values() if matches(job, where)]
+        for job in updated:
+            self._update(job, data)
+        return len(updated)
+
+    async def update(self, where, data):
+        job = self.jobs[where["id"]]
+        self._update(job, data)
+        return job
+
+    async def find_unique(self, where):
+        return self.jobs.get(where["id"])
+
+    async def find_many(self, where, order=None):
+        return [job for job in self.jobs.values() if matches(job, where)]
+
+
+@pytest.fixture
+def fake_jobs(monkeypatch):
+    fake_jobs = FakeJobs()
+    monkeypatch.setattr(jobs, "prisma", SimpleNamespace(job=fake_jobs))
+    return fake_jobs
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    runs = []
+
+    async def run_agent(job):
+        runs.append(job.id)
+        await asyncio.sleep(0.35)
+        return {"output": job.id}
+
+    monkeypatch.setattr(jobs, "_run_agent", run_agent)
+    return runs
+
+
+async def wait_for(condition, timeout=3.0):
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_event_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_lease_is_renewed_while_job_runs(fake_jobs, runs):
+    async def run():
+        runner = JobRunner(max_workers=1, lease_timeout=0.3)
+        fake_jobs.add("job")
+        runner.submit("job")
+        await wait_for(lambda: runs)
+        started_at = fake_jobs.jobs["job"].updatedAt
+
+        await asyncio.sleep(0.2)
+        assert fake_jobs.jobs["job"].status == JobStatus.RUNNING
+        assert fake_jobs.jobs["job"].updatedAt > started_at
+
+        await wait_for(lambda: fake_jobs.jobs["job"].status == JobStatus.DONE)
+
+    asyncio.run(run())
+
+
+def test_resume_requeues_expired_jobs(fake_jobs, runs):
+    async def run():
+        runner = JobRunner(max_workers=2, lease_timeout=1)
+        fake_jobs.add("lost", status=JobStatus.RUNNING, updated_ago=2)
+        fake_jobs.add("alive", status=JobStatus.RUNNING)
+        fake_jobs.add("pending")
+
+        await runner.resume()
+        await wait_for(lambda: fake_jobs.jobs["lost"].status == JobStatus.DONE)
+        runner.shutdown()
+
+        assert sorted(runs) == ["lost", "pending"]
+        assert fake_jobs.jobs["alive"].status == JobStatus.RUNNING
+
+    asyncio.run(run())
+
+
+def test_reaper_requeues_jobs_of_crashed_workers(fake_jobs, runs):
+    async def run():
+        runner = JobRunner(max_workers=1, lease_timeout=0.2)
+        await runner.resume()
+        # Claimed by a worker that crashed right after
+        fake_jobs.add("lost", status=JobStatus.RUNNING, updated_ago=1)
+
+        await wait_for(lambda: fake_jobs.jobs["lost"].status == JobStatus.DONE)
+        runner.shutdown()
+
+        assert runs == ["lost"]
+
+    asyncio.run(run())
@@ -0,0 +1,186 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+from git import Repo
+
+from app.datasource import loader
+from app.datasource.crawler import Crawler
+from app.datasource.loader import DataLoader
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = Repo.init(tmp_path / "origin")
+    with repo.config_writer() as writer:
+        writer.set_value("user", "name", "Superagent")
+        writer.set_value("user", "email", "superagent@example.com")
+    return repo
+
+
+def commit(repo, files, removed=()):
+    for path, content in files.items():
+        file_path = os.path.join(repo.working_tree_dir, path)
+        mode = "wb" if isinstance(content, bytes) else "w"
+        with open(file_path, mode) as f:
+            f.write(content)
+    if files:
+        repo.index.add(list(files))
+    if removed:
+        repo.index.remove(list(removed), working_tree=True)
+    return repo.index.commit("Update").hexsha
+
+
+def get_loader(repo) -> DataLoader:
+    datasource = SimpleNamespace(
+        type="GITHUB_REPOSITORY",
+        url=repo.working_tree_dir,
+        metadata=json.dumps({"branch": repo.active_branch.name}),
+    )
+    return DataLoader(datasource=datasource)
+
+
+def get_documents(changes):
+    return {
+        payload.metadata["source"]: payload.page_content
+        for kind, payload in changes
+        if kind == "document"
+    }
+
+
+def test_github_first_sync_loads_all_files(repo):
+    head = commit(repo, {"a.md": "a", "b.py": "b", "image.png": b"\x89PNG\xff"})
+
+    changes = list(get_loader(repo).iter_changes(None))
+
+    assert changes[0] == ("reset", None)
+    assert [kind for kind, _ in changes].count("reset") == 1
+    assert get_documents(changes) == {"a.md": "a", "b.py": "b"}
+    assert changes[-1] == ("state", {"lastCommit": head})
+
+
+def test_github_sync_loads_changed_files(repo):
+    last_commit = commit(repo, {"a.md": "a", "b.md": "b", "c.md": "c"})
+    os.rename(
+        os.path.join(repo.working_tree_dir, "c.md"),
+        os.path.join(repo.working_tree_dir, "d.md"),
+    )
+    repo.index.remove(["c.md"])
+    head = commit(repo, {"a.md": "changed", "d.md": "c", "e.md": "e"}, ["b.md"])
+
+    changes = list(get_loader(repo).iter_changes({"lastCommit": last_commit}))
+
+    assert ("reset", None) not in changes
+    deleted = {payload for kind, payload in changes if kind == "delete"}
+    assert deleted == {"a.md", "b.md", "c.md", "d.md", "e.md"}
+    assert get_documents(changes) == {"a.md": "changed", "d.md": "c", "e.md": "e"}
+    # Vectors of a file are deleted before its new chunks are added
+    for source in ("a.md", "d.md", "e.md"):
+        delete = changes.index(("delete", source))
+        document = next(
+            i
+            for i, (kind, payload) in enumerate(changes)
+            if kind == "document" and payload.metadata["source"] == source
+        )
+        assert delete < document
+    assert changes[-1] == ("state", {"lastCommit": head})
+
+
+def test_github_sync_without_changes(repo):
+    head = commit(repo, {"a.md": "a"})
+
+    changes = list(get_loader(repo).iter_changes({"lastCommit": head}))
+
+    assert changes == [("state", {"lastCommit": head})]
+
+
+def test_github_sync_reloads_unknown_commit(repo):
+    head = commit(repo, {"a.md": "a"})
+
+    changes = list(get_loader(repo).iter_changes({"lastCommit": "0" * 40}))
+
+    assert changes[0] == ("reset", None)
+    assert get_documents(changes) == {"a.md": "a"}
+    assert changes[-1] == ("state", {"lastCommit": head})
+
+
+def get_webpage_loader(site) -> DataLoader:
+    datasource = SimpleNamespace(type="WEBPAGE", url=site.url("/docs/"))
+    return DataLoader(datasource=datasource)
+
+
+def sync_webpage(site, state):
+    changes = list(get_webpage_loader(site).iter_changes(state))
+    assert changes[-1][0] == "state"
+    return changes[:-1], changes[-1][1]
+
+
+@pytest.fixture
+def docs(site):
+    links = "".join(f'<a href="/docs/{path}">{path}</a>' for path in "abc")
+    site.add_page("/docs/", f"Index{links}", etag='"index"')
+    site.add_page("/docs/a", "A", etag='"a"')
+    site.add_page("/docs/b", "B")
+    site.add_page("/docs/c", "C")
+    return site
+
+
+def test_webpage_first_sync_loads_all_pages(docs):
+    changes, state = sync_webpage(docs, None)
+
+    assert changes[0] == ("reset", None)
+    assert set(get_documents(changes)) == {
+        docs.url(f"/docs/{path}") for path in ["", "a", "b", "c"]
+    }
+    assert state["pages"][docs.url("/docs/a")]["etag"] == '"a"'
+
+
+def test_webpage_sync_loads_changed_pages(docs):
+    _, state = sync_webpage(docs, None)
+    docs.requests.clear()
+    docs.add_page("/docs/b", "B changed")
+
+    changes, synced_state = sync_webpage(docs, state)
+
+    assert changes == [
+        ("delete", docs.url("/docs/b")),
+        ("document", changes[1][1]),
+    ]
+    assert changes[1][1].page_content == "B changed"
+    assert synced_state["pages"].keys() == state["pages"].keys()
+    # Pages with an ETag answered 304 and were not downloaded again
+    assert docs.requests.count("/docs/a") == 1
+
+
+def test_webpage_sync_deletes_removed_pages(docs):
+    _, state = sync_webpage(docs, None)
+    del docs.pages["/docs/c"]
+
+    changes, synced_state = sync_webpage(docs, state)
+
+    assert changes == [("delete", docs.url("/docs/c"))]
+    assert docs.url("/docs/c") not in synced_state["pages"]
+
+
+@pytest.mark.parametrize("status", [500, 503, 429, 403])
+def test_webpage_sync_keeps_unavailable_pages(docs, status):
+    _, state = sync_webpage(docs, None)
+    docs.pages["/docs/"]["status"] = status
+    docs.pages["/docs/"]["etag"] = None
+    docs.pages["/docs/b"]["status"] = status
+
+    changes, synced_state = sync_webpage(docs, state)
+
+    assert changes == []
+    assert synced_state == state
+
+
+def test_webpage_sync_keeps_pages_left_out_of_truncated_crawl(docs, monkeypatch):
+    _, state = sync_webpage(docs, None)
+    monkeypatch.setattr(loader, "Crawler", lambda: Crawler(host_delay=0, max_pages=2))
+
+    changes, synced_state = sync_webpage(docs, state)
+
+    assert not [change for change in changes if change[0] == "delete"]
+    assert synced_state == state
@@ -0,0 +1,76 @@
+import base64
+import io
+from types import SimpleNamespace
+
+import pytest
+from pypdf import PdfWriter
+
+from app.datasource import pdf
+from app.datasource.loader import DataLoader
+
+
+def write_pdf(page_count: int) -> bytes:
+    writer = PdfWriter()
+    for _ in range(page_count):
+        writer.add_blank_page(width=100, height=100)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pdf_pool(monkeypatch):
+    monkeypatch.setattr(pdf, "PDF_WORKERS", 2)
+    monkeypatch.setattr(pdf, "PDF_PAGES_PER_TASK", 3)
+    yield
+    pdf.shutdown_pdf_executor()
+
+
+@pytest.mark.usefixtures("pdf_pool")
+@pytest.mark.parametrize("page_count", [2, 20])
+def test_parse_pdf_yields_pages_in_order(tmp_path, page_count):
+    file_path = tmp_path / "file.pdf"
+    file_path.write_bytes(write_pdf(page_count))
+
+    pages = list(pdf.parse_pdf(str(file_path), "file.pdf"))
+
+    assert [page.metadata for page in pages] == [
+        {"source": "file.pdf", "page": page} for page in range(page_count)
+    ]
+
+
+@pytest.mark.usefixtures("pdf_pool")
+def test_parse_pdf_limits_ranges_in_flight(tmp_path):
+    file_path = tmp_path / "file.pdf"
+    file_path.write_bytes(write_pdf(30))
+    submitted = []
+    executor = pdf.get_pdf_executor()
+    submit = executor.submit
+
+    def count_submit(*args):
+        submitted.append(args)
+        return submit(*args)
+
+    executor.submit = count_submit
+    pages = pdf.parse_pdf(str(file_path), "file.pdf")
+    next(pages)
+
+    # Two ranges per worker, and the next one once the first was parsed
+    assert len(submitted) == 5
+    pages.close()
+
+
+@pytest.mark.usefixtures("pdf_pool")
+def test_load_uploaded_pdf():
+    datasource = SimpleNamespace(
+        type="PDF",
+        name="Report",
+        url=None,
+        content=base64.b64encode(write_pdf(4)).decode(),
+    )
+
+    pages = list(DataLoader(datasource=datasource).lazy_load_pdf())
+
+    assert [page.metadata for page in pages] == [
+        {"source": "Report", "page": page} for page in range(4)
+    ]
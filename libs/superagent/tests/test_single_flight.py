@@ -0,0 +1,104 @@
+import asyncio
+
+from app.utils.single_flight import SingleFlight, StreamingSingleFlight
+
+
+async def collect(stream):
+    return [frame async for frame in stream]
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def fn():
+        calls.append(None)
+        await asyncio.sleep(0.05)
+        return "output"
+
+    async def run():
+        single_flight = SingleFlight()
+        outputs = await asyncio.gather(
+            single_flight.do(("agent", "input"), fn),
+            single_flight.do(("agent", "input"), fn),
+            single_flight.do(("agent", "other input"), fn),
+        )
+        # A finished call is not shared with later calls
+        outputs.append(await single_flight.do(("agent", "input"), fn))
+        return outputs
+
+    assert asyncio.run(run()) == ["output"] * 4
+    assert len(calls) == 3
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def fn():
+        await asyncio.sleep(0.05)
+        return "output"
+
+    async def run():
+        single_flight = SingleFlight()
+        leader = asyncio.ensure_future(single_flight.do(("agent", "input"), fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.do(("agent", "input"), fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        return await asyncio.wait_for(follower, timeout=1)
+
+    assert asyncio.run(run()) == "output"
+
+
+def test_stream_is_read_once_and_replayed_to_late_subscribers():
+    reads = []
+
+    async def source():
+        reads.append(None)
+        for frame in ["a", "b", "c"]:
+            yield frame
+            await asyncio.sleep(0.02)
+
+    async def run():
+        single_flight = StreamingSingleFlight()
+        first = asyncio.ensure_future(
+            collect(single_flight.subscribe(("agent", "input"), source()))
+        )
+        await asyncio.sleep(0.03)
+        second = collect(single_flight.subscribe(("agent", "input"), source()))
+
+        return await asyncio.wait_for(asyncio.gather(first, second), timeout=1)
+
+    assert asyncio.run(run()) == [["a", "b", "c"], ["a", "b", "c"]]
+    assert len(reads) == 1
+
+
+def test_stream_is_cancelled_when_the_last_subscriber_leaves():
+    closed = []
+
+    async def source():
+        try:
+            while True:
+                yield "frame"
+                await asyncio.sleep(0.01)
+        finally:
+            closed.append(None)
+
+    async def run():
+        single_flight = StreamingSingleFlight()
+        first = single_flight.subscribe(("agent", "input"), source())
+        second = single_flight.subscribe(("agent", "input"), source())
+        await first.__anext__()
+        await second.__anext__()
+
+        await first.aclose()
+        await asyncio.sleep(0.05)
+        assert not closed
+
+        await second.aclose()
+        await asyncio.sleep(0.05)
+        assert closed
+        # The next call starts a new stream
+        third = single_flight.subscribe(("agent", "input"), source())
+        assert await third.__anext__() == "frame"
+        await third.aclose()
+
+    asyncio.run(run())
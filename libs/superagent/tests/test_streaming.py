@@ -0,0 +1,87 @@
+import asyncio
+
+from app.utils.streaming import CustomAsyncIteratorCallbackHandler, StreamEvent
+
+
+async def collect(stream):
+    return [token async for token in stream]
+
+
+def test_done_ends_the_stream():
+    async def run():
+        callback = CustomAsyncIteratorCallbackHandler()
+        await callback.on_llm_new_token("a")
+        await callback.on_llm_new_token("b")
+        callback.done.set()
+        # Setting it again doesn't end a later stream early
+        callback.done.set()
+
+        return await asyncio.wait_for(collect(callback.aiter()), timeout=1)
+
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_stream_continues_after_consecutive_llm_call():
+    async def run():
+        callback = CustomAsyncIteratorCallbackHandler()
+        await callback.on_llm_new_token("a")
+        callback.done.set()
+        await callback.on_llm_start({}, [])
+        await callback.on_llm_new_token("b")
+        stream = asyncio.ensure_future(collect(callback.aiter()))
+        await asyncio.sleep(0.05)
+        assert not stream.done()
+
+        callback.done.set()
+        return await asyncio.wait_for(stream, timeout=1)
+
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_coalesced_stream_flushes_at_flush_bytes():
+    async def run():
+        callback = CustomAsyncIteratorCallbackHandler()
+        for token in ["ab", "cd", "é", "f"]:
+            await callback.on_llm_new_token(token)
+        callback.done.set()
+
+        return await asyncio.wait_for(
+            collect(callback.aiter_coalesced(flush_bytes=4)), timeout=1
+        )
+
+    assert asyncio.run(run()) == ["abcd", "éf"]
+
+
+def test_coalesced_stream_flushes_at_flush_interval():
+    async def run():
+        callback = CustomAsyncIteratorCallbackHandler()
+        stream = asyncio.ensure_future(
+            collect(callback.aiter_coalesced(flush_interval=0.05))
+        )
+        await callback.on_llm_new_token("a")
+        await callback.on_llm_new_token("b")
+        await asyncio.sleep(0.15)
+        await callback.on_llm_new_token("c")
+        callback.done.set()
+
+        return await asyncio.wait_for(stream, timeout=1)
+
+    assert asyncio.run(run()) == ["ab", "c"]
+
+
+def test_coalesced_stream_sends_events_in_order():
+    event = StreamEvent(event="function_call", data={"function": "search"})
+
+    async def run():
+        callback = CustomAsyncIteratorCallbackHandler()
+        await callback.on_llm_new_token("a")
+        await callback.on_llm_new_token("b")
+        callback.queue.put_nowait(event)
+        await callback.on_llm_new_token("c")
+        callback.done.set()
+
+        return await asyncio.wait_for(
+            collect(callback.aiter_coalesced(flush_interval=10)), timeout=1
+        )
+
+    assert asyncio.run(run()) == ["ab", event, "c"]
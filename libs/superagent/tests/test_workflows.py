@@ -0,0 +1,181 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Response
+
+from app.api import workflows as workflows_api
+from app.models.request import WorkflowInvoke
+from app.utils.cache import LocalCache
+from app.utils.streaming import CustomAsyncIteratorCallbackHandler
+from app.workflows import base
+from app.workflows.base import WorkflowBase
+
+
+class FakeAgentBase:
+    """
+    Builds agents that stream the step's agent id and their input, the agent of
+    agent id `fail` raises instead
+    """
+
+    builds = []
+    calls = []
+
+    def __init__(self, agent_id, callback, **_kwargs):
+        self.agent_id = agent_id
+        self.callback = callback
+
+    async def get_agent(self):
+        self.builds.append(self.agent_id)
+        return self
+
+    async def acall(self, inputs):
+        self.calls.append(self.agent_id)
+        if self.agent_id == "fail":
+            raise Exception("Agent failed")
+        output = f"{self.agent_id}({inputs['input']})"
+        await self.callback.on_llm_new_token(output)
+        self.callback.done.set()
+        return {"output": output}
+
+
+class FakeTable:
+    def __init__(self):
+        self.rows = []
+
+    async def create(self, data):
+        self.rows.append(data)
+        return SimpleNamespace(**data)
+
+    async def update(self, where, data):
+        self.rows.append({**where, **data})
+
+
+@pytest.fixture
+def fake_prisma(monkeypatch):
+    fake_prisma = SimpleNamespace(workflowrun=FakeTable(), workflowsteprun=FakeTable())
+    monkeypatch.setattr(base, "prisma", fake_prisma)
+    monkeypatch.setattr(base, "step_cache", LocalCache())
+    monkeypatch.setattr(FakeAgentBase, "builds", [])
+    monkeypatch.setattr(FakeAgentBase, "calls", [])
+    monkeypatch.setattr(base, "AgentBase", FakeAgentBase)
+    return fake_prisma
+
+
+async def collect(stream):
+    return [token async for token in stream]
+
+
+def get_step(agent_id, order, memoize=False):
+    agent = SimpleNamespace(
+        name=agent_id,
+        updatedAt=datetime(2023, 1, 1, tzinfo=timezone.utc),
+        llmModel="GPT_3_5_TURBO_16K_0613",
+        llms=[],
+        tools=[],
+        datasources=[],
+    )
+    return SimpleNamespace(
+        id=f"{agent_id}-step",
+        order=order,
+        agentId=agent_id,
+        agent=agent,
+        memoize=memoize,
+        mapInput=False,
+        mapConcurrency=1,
+    )
+
+
+def run_workflow(steps, input, **kwargs):
+    async def run():
+        workflow = SimpleNamespace(id="workflow", steps=steps)
+        callbacks = [CustomAsyncIteratorCallbackHandler() for _ in steps]
+        return await WorkflowBase(
+            workflow=workflow, callbacks=callbacks, session_id="session", **kwargs
+        ).arun(input)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.usefixtures("fake_prisma")
+def test_memoized_step_is_built_on_cache_miss_only():
+    steps = [get_step("a", 0, memoize=True), get_step("b", 1)]
+
+    first = run_workflow(steps, "input")
+    second = run_workflow(steps, "input")
+
+    assert first["output"] == second["output"] == "b(a(input))"
+    assert FakeAgentBase.builds == ["b", "a", "b"]
+    assert FakeAgentBase.calls == ["a", "b", "b"]
+
+
+@pytest.mark.usefixtures("fake_prisma")
+def test_memoized_step_is_versioned_by_agent_config():
+    steps = [get_step("a", 0, memoize=True)]
+
+    run_workflow(steps, "input")
+    steps[0].agent.updatedAt = datetime(2023, 1, 2, tzinfo=timezone.utc)
+    run_workflow(steps, "input")
+
+    assert FakeAgentBase.calls == ["a", "a"]
+
+
+def test_streamed_run_ends_streams_when_a_step_fails(fake_prisma, monkeypatch):
+    steps = [get_step("a", 0), get_step("fail", 1), get_step("b", 2)]
+
+    async def load_workflow_config(workflow_id):
+        return SimpleNamespace(id=workflow_id, steps=steps)
+
+    monkeypatch.setattr(workflows_api, "load_workflow_config", load_workflow_config)
+
+    async def run():
+        response = await workflows_api.invoke(
+            workflow_id="workflow",
+            body=WorkflowInvoke(input="input", enableStreaming=True),
+            response=Response(),
+            api_user=SimpleNamespace(id="api-user"),
+            _admission_ticket=None,
+        )
+        return [frame async for frame in response.body_iterator]
+
+    frames = asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+    assert frames[1] == "id: a\ndata: a(input)\n\n"
+    assert frames[-1].startswith("event: error\n")
+    assert "Agent failed" in frames[-1]
+    assert fake_prisma.workflowrun.rows[-1]["status"] == "FAILED"
+
+
+def test_resumed_run_replays_completed_steps(fake_prisma):
+    steps = [get_step("a", 0), get_step("b", 1)]
+    step_run = SimpleNamespace(
+        stepId="a-step", output="a(input)", response={"output": "a(input)"}
+    )
+
+    async def find_unique_or_raise(where, include):
+        assert where == {"id": "run"} and include == {"steps": True}
+        return SimpleNamespace(workflowId="workflow", input="input", steps=[step_run])
+
+    fake_prisma.workflowrun.find_unique_or_raise = find_unique_or_raise
+
+    async def run():
+        workflow = SimpleNamespace(id="workflow", steps=steps)
+        callbacks = [CustomAsyncIteratorCallbackHandler() for _ in steps]
+        output = await WorkflowBase(
+            workflow=workflow,
+            callbacks=callbacks,
+            session_id="session",
+            run_id="run",
+        ).arun("ignored input")
+        return output, await collect(callbacks[0].aiter())
+
+    output, replayed = asyncio.run(run())
+
+    assert output["runId"] == "run"
+    assert output["steps"][0] == {"output": "a(input)"}
+    assert output["output"] == "b(a(input))"
+    assert replayed == ["a(input)"]
+    assert FakeAgentBase.builds == FakeAgentBase.calls == ["b"]
+    assert [row["stepId"] for row in fake_prisma.workflowsteprun.rows] == ["b-step"]
+    assert fake_prisma.workflowsteprun.rows[0]["runId"] == "run"